@@ -6,40 +6,65 @@ Takes assembly data (positions) and creates a combined DXF file.
 Products are processed in the order provided (sequence matters for assembly).
 """
 
+import gc
+import os
 import sys
-import json
+import logging
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 
+import numpy as np
+import orjson
 import ezdxf
 from ezdxf.addons import Importer
-from ezdxf import bbox
+from ezdxf import bbox, recover
+from ezdxf.document import Drawing
+from ezdxf.entities import DXFGraphic
+from ezdxf.lldxf import const
+from ezdxf.lldxf.validator import is_valid_table_name
+from ezdxf.math import Matrix44, Vec3, Z_AXIS
+
+logger = logging.getLogger(__name__)
+
+# Shared defaults for products without position/rotation/scale data
+_ORIGIN = (0.0, 0.0, 0.0)
+_UNIT_SCALE = (1.0, 1.0, 1.0)
 
 
 class DXFProduct:
     """Represents a product in the DXF assembly with its transformation data"""
     
+    __slots__ = (
+        'id', 'product_id', 'name', 'position', 'rotation', 'scale',
+        'parent_id', 'child_position', 'level',
+    )
+    
     def __init__(self, data: dict):
-        self.id = data.get('id', '')
-        self.product_id = data.get('productId', '')
-        self.name = data.get('name', '')
+        get = data.get
+        self.id = get('id', '')
+        self.product_id = get('productId', '')
+        self.name = get('name', '')
         
         # Position in meters (from frontend)
-        pos = data.get('position', [0, 0, 0])
-        self.position = (float(pos[0]), float(pos[1]), float(pos[2]))
+        pos = get('position')
+        self.position = _ORIGIN if pos is None else (float(pos[0]), float(pos[1]), float(pos[2]))
         
         # Rotation in radians (from frontend) - for future use
-        rot = data.get('rotation', [0, 0, 0])
-        self.rotation = (float(rot[0]), float(rot[1]), float(rot[2]))
+        rot = get('rotation')
+        self.rotation = _ORIGIN if rot is None else (float(rot[0]), float(rot[1]), float(rot[2]))
         
         # Scale factors - for future use
-        scale = data.get('scale', [1, 1, 1])
-        self.scale = (float(scale[0]), float(scale[1]), float(scale[2]))
+        scale = get('scale')
+        self.scale = _UNIT_SCALE if scale is None else (float(scale[0]), float(scale[1]), float(scale[2]))
         
         # Parent reference for hierarchy
-        self.parent_id = data.get('parentId')
-        self.child_position = data.get('childPosition')
-        self.level = data.get('level', 0)
+        self.parent_id = get('parentId')
+        self.child_position = get('childPosition')
+        self.level = get('level', 0)
     
     @property
     def z_offset_mm(self) -> float:
@@ -52,22 +77,171 @@ class DXFProduct:
         return self.position[1] * 1000.0
 
 
+def _compute_bbox(msp) -> Optional[Tuple[float, float, float, float]]:
+    """
+    Get bounding box (min_x, min_y, max_x, max_y) of modelspace entities
+    
+    Returns:
+        Tuple of (min_x, min_y, max_x, max_y) or None if calculation fails
+    """
+    try:
+        # Use ezdxf.bbox module for proper bounding box calculation. No
+        # bbox.Cache: it is keyed by entity handle, so it cannot be shared
+        # between source documents, and one extents() pass never hits it.
+        bounding_box = bbox.extents(msp)
+        if bounding_box.has_data:
+            return (bounding_box.extmin.x, bounding_box.extmin.y, 
+                    bounding_box.extmax.x, bounding_box.extmax.y)
+    except Exception as e:
+        logger.warning("bbox.extents failed: %s", e)
+    return None
+
+
+def _read_dxf(dxf_path: str) -> Drawing:
+    """
+    Read a DXF file with the regular loader
+    
+    The slower recover loader is only used for files the regular loader
+    rejects as structurally invalid.
+    """
+    try:
+        return ezdxf.readfile(dxf_path)
+    except ezdxf.DXFStructureError:
+        source_doc, auditor = recover.readfile(dxf_path)
+        return source_doc
+
+
+def _parse_product(dxf_path: str, with_bbox: bool) -> Tuple[Drawing, Optional[Tuple[float, float, float, float]]]:
+    """Parse a source DXF file and optionally compute its bounding box (runs in a worker process)"""
+    source_doc = _read_dxf(dxf_path)
+    bbox_data = _compute_bbox(source_doc.modelspace()) if with_bbox else None
+    return source_doc, bbox_data
+
+
+def _translate_entities(entities: List[DXFGraphic], translate_x: float, translate_y: float) -> int:
+    """
+    Translate entities in the XY plane
+    
+    LINE, LWPOLYLINE, CIRCLE and ARC entities with the default extrusion
+    (OCS == WCS) get their coordinates shifted directly, the LWPOLYLINE
+    vertex buffer with a single NumPy add. All other entities go through
+    the generic transform() with one shared translation matrix.
+    
+    Returns:
+        Number of translated entities
+    """
+    offset = Vec3(translate_x, translate_y, 0)
+    xy_offset = np.array((translate_x, translate_y))
+    translation = Matrix44.translate(translate_x, translate_y, 0)
+    translated_count = 0
+    untranslatable = set()
+    remaining = iter(entities)
+    while True:
+        # One guard around the whole loop: after a failure the loop resumes
+        # with the entity following the one that raised
+        try:
+            for entity in remaining:
+                dxftype = entity.dxftype()
+                if dxftype == 'LINE':
+                    entity.dxf.start = offset + entity.dxf.start
+                    entity.dxf.end = offset + entity.dxf.end
+                elif dxftype == 'LWPOLYLINE' and entity.dxf.extrusion == Z_AXIS:
+                    # Rows are (x, y, start_width, end_width, bulge)
+                    vertices = np.asarray(entity.lwpoints.values).reshape(-1, 5)
+                    vertices[:, :2] += xy_offset
+                elif dxftype in ('CIRCLE', 'ARC') and entity.dxf.extrusion == Z_AXIS:
+                    entity.dxf.center = offset + entity.dxf.center
+                elif dxftype in untranslatable:
+                    continue
+                else:
+                    entity.transform(translation)
+                translated_count += 1
+            return translated_count
+        except NotImplementedError:
+            # Type does not support transform(), skip the rest of its kind
+            untranslatable.add(entity.dxftype())
+            logger.warning("    Could not translate %s entities", entity.dxftype())
+        except Exception as e:
+            logger.warning("    Could not translate entity %s: %s", entity.dxftype(), e)
+
+
+@contextmanager
+def _gc_paused():
+    """Disable cyclic garbage collection for the duration of the block"""
+    # Only the caller that actually disabled GC turns it back on, so
+    # overlapping assemblies in other threads never leave it disabled
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+class _RecordingLayout:
+    """
+    Stand-in target layout for Importer that records every added entity
+    
+    Forwards add_entity() to the wrapped layout, so the entities created by
+    an import are known without re-listing the whole output modelspace.
+    """
+    
+    def __init__(self, layout):
+        self.layout = layout
+        self.doc = layout.doc
+        self.added: List[DXFGraphic] = []
+    
+    def add_entity(self, entity: DXFGraphic) -> None:
+        self.layout.add_entity(entity)
+        self.added.append(entity)
+
+
 class DXFAssembler:
     """Assembles DXF files into a single document with transformations"""
     
-    def __init__(self, dxf_base_path: str, output_path: str):
+    def __init__(
+        self,
+        dxf_base_path: str,
+        output_path: str,
+        verbose: bool = False,
+        use_blocks: bool = True,
+        binary: bool = False,
+        parse_workers: Optional[int] = None
+    ):
         """
         Initialize the assembler
         
         Args:
             dxf_base_path: Base directory containing DXF files
             output_path: Path for the output assembly DXF file
+            verbose: Also compute and report each source's bounding box
+            use_blocks: Import each unique source once as a BLOCK and place
+                every occurrence with an INSERT; if False, copy and translate
+                the entities of every occurrence into modelspace
+            binary: Write the output as binary DXF (smaller and faster to
+                encode, but not every DXF consumer reads it)
+            parse_workers: Processes for parsing the source files in parallel
+                (default: CPU count, 1 parses in this process)
         """
         self.dxf_base_path = Path(dxf_base_path)
         self.output_path = output_path
+        self.verbose = verbose
+        self.use_blocks = use_blocks
+        self.binary = binary
+        self.parse_workers = parse_workers if parse_workers is not None else (os.cpu_count() or 1)
         self.products: List[DXFProduct] = []
         self.output_doc = None
         self.msp_output = None
+        # Parsed source documents keyed by product ID (products may repeat)
+        self._doc_cache: Dict[str, Drawing] = {}
+        self._bbox_cache: Dict[str, Optional[Tuple[float, float, float, float]]] = {}
+        # Output block name per product ID (block mode)
+        self._product_blocks: Dict[str, str] = {}
+        # Importers awaiting finalize(), run once after all products are merged
+        self._importers: List[Importer] = []
+        # (product ID, exception) for every product that failed to merge
+        self.errors: List[Tuple[str, Exception]] = []
         
     def load_assembly_data(self, assembly_data: List[dict]) -> None:
         """
@@ -75,50 +249,248 @@ class DXFAssembler:
         IMPORTANT: Products are processed in the order provided (sequence matters)
         """
         self.products = [DXFProduct(p) for p in assembly_data]
-        print(f"Loaded {len(self.products)} products for DXF assembly")
-        print(f"Assembly sequence:")
+        logger.info("Loaded %d products for DXF assembly", len(self.products))
+        logger.info("Assembly sequence:")
         for i, p in enumerate(self.products):
-            print(f"  {i+1}. {p.product_id} (z_offset={p.z_offset_mm:.1f}mm)")
+            logger.info("  %d. %s (z_offset=%.1fmm)", i + 1, p.product_id, p.z_offset_mm)
         
     def _get_dxf_path(self, product_id: str) -> Path:
         """Get the DXF file path for a product"""
         return self.dxf_base_path / f"{product_id}.dxf"
     
-    def _get_bbox(self, msp) -> Optional[Tuple[float, float, float, float]]:
+    def _load_source(self, product_id: str) -> Drawing:
         """
-        Get bounding box (min_x, min_y, max_x, max_y) of modelspace entities
+        Get the parsed source DXF document for a product
+        
+        Each source file is parsed only once; repeated occurrences of the
+        same product ID reuse the cached document.
+        """
+        source_doc = self._doc_cache.get(product_id)
+        if source_doc is None:
+            source_doc = _read_dxf(str(self._get_dxf_path(product_id)))
+            self._doc_cache[product_id] = source_doc
+        return source_doc
+    
+    def _get_bbox(self, product_id: str, msp) -> Optional[Tuple[float, float, float, float]]:
+        """Get the bounding box of a product's source modelspace (computed once per product ID)"""
+        if product_id not in self._bbox_cache:
+            self._bbox_cache[product_id] = _compute_bbox(msp)
+        return self._bbox_cache[product_id]
+    
+    def _parse_sources(self) -> None:
+        """
+        Parse all unique source DXF files up front, in a process pool when
+        there is more than one file and parse_workers allows it
+        
+        Parsing and bbox computation are CPU-bound pure Python with no shared
+        state, so they run in worker processes; the merge into the output
+        document stays on the main process. Files that fail to parse here are
+        left uncached so _load_source() re-reads them and the error is
+        reported against the product.
+        """
+        pending: Dict[str, str] = {}
+        for product in self.products:
+            product_id = product.product_id
+            if product_id in self._doc_cache or product_id in pending:
+                continue
+            dxf_path = self._get_dxf_path(product_id)
+            if dxf_path.exists():
+                pending[product_id] = str(dxf_path)
+        
+        max_workers = min(len(pending), self.parse_workers)
+        if max_workers < 2:
+            # Nothing to parallelize, parse inline
+            for product_id, dxf_path in pending.items():
+                try:
+                    self._doc_cache[product_id] = _read_dxf(dxf_path)
+                except Exception:
+                    pass  # Re-read and reported by the merge loop
+            return
+        
+        logger.info("Parsing %d source DXF files with %d workers", len(pending), max_workers)
+        # Spawned rather than forked, since the caller (e.g. the server)
+        # may have other threads running
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            futures = {
+                product_id: executor.submit(_parse_product, dxf_path, self.verbose)
+                for product_id, dxf_path in pending.items()
+            }
+            for product_id, future in futures.items():
+                try:
+                    source_doc, bbox_data = future.result()
+                except Exception as e:
+                    logger.warning("Parallel parse failed for %s: %s", product_id, e)
+                    continue
+                self._doc_cache[product_id] = source_doc
+                if self.verbose:
+                    self._bbox_cache[product_id] = bbox_data
+    
+    def _select_output_version(self) -> str:
+        """
+        Pick the DXF version for the output document
+        
+        When all parsed sources share a version that ezdxf can create, the
+        output uses that version so imported entities keep their native
+        version; otherwise R2010 is used for better compatibility.
+        """
+        versions = {source_doc.dxfversion for source_doc in self._doc_cache.values()}
+        if len(versions) == 1:
+            version = versions.pop()
+            if version in const.versions_supported_by_new:
+                return version
+        return 'R2010'
+    
+    def _new_block_name(self, product_id: str) -> str:
+        """
+        Get an unused block name for a product
+        
+        PROD_<productId> when that is a valid DXF table name, otherwise (or
+        if it is taken) PROD_<n> with the first free number.
+        """
+        block_name = f"PROD_{product_id}"
+        if is_valid_table_name(block_name) and block_name not in self.output_doc.blocks:
+            return block_name
+        n = len(self._product_blocks) + 1
+        while f"PROD_{n}" in self.output_doc.blocks:
+            n += 1
+        return f"PROD_{n}"
+    
+    def _import_block(self, product_id: str, source_doc: Drawing) -> str:
+        """
+        Import a product's source modelspace as a BLOCK definition
         
         Returns:
-            Tuple of (min_x, min_y, max_x, max_y) or None if calculation fails
+            Name of the new block
         """
+        block_name = self._new_block_name(product_id)
+        block = self.output_doc.blocks.new(name=block_name)
         try:
-            # Use ezdxf.bbox module for proper bounding box calculation
-            cache = bbox.Cache()
-            bounding_box = bbox.extents(msp, cache=cache)
-            if bounding_box.has_data:
-                return (bounding_box.extmin.x, bounding_box.extmin.y, 
-                        bounding_box.extmax.x, bounding_box.extmax.y)
-        except Exception as e:
-            print(f"    bbox.extents failed: {e}")
+            importer = Importer(source_doc, self.output_doc)
+            importer.import_modelspace(target_layout=block)
+        except Exception:
+            # Drop the half-built block, so a later occurrence of the
+            # product reports the real error instead of a name clash
+            self.output_doc.blocks.delete_block(block_name, safe=False)
+            raise
+        self._importers.append(importer)
+        self._product_blocks[product_id] = block_name
+        logger.info("  Imported %d entities into block %s", len(block), block_name)
+        return block_name
+    
+    def _import_translated(self, source_doc: Drawing, translate_x: float, translate_y: float) -> int:
+        """
+        Copy a product's source modelspace into the output modelspace and translate the copies
+        
+        Returns:
+            Number of entities added to the output modelspace
+        """
+        # Use Importer to copy entities from source to output,
+        # recording the copies as they are added
+        target_layout = _RecordingLayout(self.msp_output)
+        importer = Importer(source_doc, self.output_doc)
+        importer.import_modelspace(target_layout=target_layout)
+        self._importers.append(importer)
+        new_entities = target_layout.added
         
-        # Fallback: manually calculate from entities
-        min_x = min_y = float('inf')
-        max_x = max_y = float('-inf')
+        logger.info("  Imported %d entities", len(new_entities))
         
-        for entity in msp:
+        # The reference product (and any product level with it) stays put
+        if translate_x == 0.0 and translate_y == 0.0:
+            logger.info("  Zero translation, entities left in place")
+            return len(new_entities)
+        
+        # Translate only the newly imported entities
+        translated_count = _translate_entities(new_entities, translate_x, translate_y)
+        
+        logger.info("  Successfully translated %d entities", translated_count)
+        return len(new_entities)
+    
+    def _merge_products(self, first_product_z_offset: float) -> int:
+        """
+        Place every product in the output document, in the loaded order
+        
+        Returns:
+            Number of entities placed in the output modelspace
+        """
+        # Entities placed in the output modelspace, counted as they are added
+        entities_added = 0
+        
+        # Process each product in the provided order (sequence matters!)
+        for i, product in enumerate(self.products):
+            dxf_path = self._get_dxf_path(product.product_id)
+            
+            if not dxf_path.exists():
+                logger.warning("DXF file not found: %s", dxf_path)
+                continue
+            
+            logger.info("Processing [%d/%d]: %s (%s)", i + 1, len(self.products), product.name, product.product_id)
+            logger.info("  Position (m): %s", product.position)
+            logger.info("  Z offset (mm): %.2f", product.z_offset_mm)
+            
             try:
-                entity_bbox = bbox.extents([entity])
-                if entity_bbox.has_data:
-                    min_x = min(min_x, entity_bbox.extmin.x)
-                    min_y = min(min_y, entity_bbox.extmin.y)
-                    max_x = max(max_x, entity_bbox.extmax.x)
-                    max_y = max(max_y, entity_bbox.extmax.y)
-            except:
-                pass
+                # Read the source DXF file (parsed once per product ID)
+                source_doc = self._load_source(product.product_id)
+                msp_source = source_doc.modelspace()
+                
+                # Get bounding box info (only reported, not needed for the merge)
+                if self.verbose:
+                    bbox_data = self._get_bbox(product.product_id, msp_source)
+                    if bbox_data:
+                        min_x, min_y, max_x, max_y = bbox_data
+                        center_x = (min_x + max_x) / 2
+                        center_y = (min_y + max_y) / 2
+                        width = max_x - min_x
+                        height = max_y - min_y
+                        logger.info("  BBox: (%.1f, %.1f) to (%.1f, %.1f)", min_x, min_y, max_x, max_y)
+                        logger.info("  Size: %.1f x %.1f, Center: (%.1f, %.1f)", width, height, center_x, center_y)
+                    else:
+                        logger.warning("  Could not calculate bounding box")
+                
+                # Calculate translation RELATIVE to the first product
+                # Formula matches AssemblerContext.tsx positioning logic:
+                # - First product is the anchor (leftmost), stays at X=0
+                # - Other products are positioned to the RIGHT of it
+                # - If first product has higher Z, other products with lower Z go to the right
+                # translate_x = first_z_offset - product_z_offset
+                #   First (z=48): 48 - 48 = 0 (anchor)
+                #   Second (z=0): 48 - 0 = +48 (to the right)
+                #   Third (z=-80): 48 - (-80) = +128 (further right)
+                translate_x = first_product_z_offset - product.z_offset_mm
+                translate_y = product.y_offset_mm  # Y stays as Y
+                
+                logger.info("  Relative X translation: %.1f - %.1f = %.1fmm",
+                            first_product_z_offset, product.z_offset_mm, translate_x)
+                logger.info("  Applying translation: X=%.1fmm, Y=%.1fmm", translate_x, translate_y)
+                
+                if self.use_blocks:
+                    # Import each unique source once, then reference it
+                    block_name = self._product_blocks.get(product.product_id)
+                    if block_name is None:
+                        block_name = self._import_block(product.product_id, source_doc)
+                    self.msp_output.add_blockref(block_name, insert=(translate_x, translate_y, 0))
+                    entities_added += 1
+                    logger.info("  Inserted block %s", block_name)
+                else:
+                    entities_added += self._import_translated(source_doc, translate_x, translate_y)
+                
+            except Exception as e:
+                # Tracebacks are formatted once the merge is done
+                self.errors.append((product.product_id, e))
+                continue
         
-        if min_x != float('inf'):
-            return (min_x, min_y, max_x, max_y)
-        return None
+        return entities_added
+    
+    def _report_errors(self) -> None:
+        """Log every product that failed to merge, with its traceback"""
+        if not self.errors:
+            return
+        logger.error("%d product(s) could not be merged:", len(self.errors))
+        for product_id, error in self.errors:
+            logger.error("  Error processing %s: %s\n%s", product_id, error,
+                         ''.join(traceback.format_exception(error)).rstrip())
     
     def assemble(self) -> bool:
         """
@@ -132,130 +504,82 @@ class DXFAssembler:
             True if successful, False otherwise
         """
         try:
-            print(f"\nStarting DXF assembly with {len(self.products)} products")
-            print(f"DXF files base path: {self.dxf_base_path}")
+            logger.info("Starting DXF assembly with %d products", len(self.products))
+            logger.info("DXF files base path: %s", self.dxf_base_path)
             
             if not self.products:
-                print("Error: No products to assemble")
+                logger.error("No products to assemble")
                 return False
             
+            # Block names and importers refer to the previous output document
+            self.errors.clear()
+            self._product_blocks.clear()
+            self._importers.clear()
+            
+            # Parse all source files before the (sequential) merge
+            self._parse_sources()
+            
             # Create a new DXF document for the assembly
-            print("\nCreating new DXF assembly document...")
-            self.output_doc = ezdxf.new('R2010')  # R2010 for better compatibility
+            dxfversion = self._select_output_version()
+            logger.info("Creating new DXF assembly document (%s)...", dxfversion)
+            self.output_doc = ezdxf.new(dxfversion)
             self.msp_output = self.output_doc.modelspace()
             
             # The FIRST product is the reference point (no translation)
             # All other products are positioned RELATIVE to the first product
             first_product_z_offset = self.products[0].z_offset_mm
-            print(f"\nReference product: {self.products[0].product_id}")
-            print(f"Reference Z offset: {first_product_z_offset:.2f}mm")
-            print(f"All other products will be positioned relative to this.\n")
+            logger.info("Reference product: %s", self.products[0].product_id)
+            logger.info("Reference Z offset: %.2fmm", first_product_z_offset)
+            logger.info("All other products will be positioned relative to this.")
             
-            # Process each product in the provided order (sequence matters!)
-            for i, product in enumerate(self.products):
-                dxf_path = self._get_dxf_path(product.product_id)
-                
-                if not dxf_path.exists():
-                    print(f"Warning: DXF file not found: {dxf_path}")
-                    continue
+            # Cyclic GC only pauses the merge here: the source documents and
+            # everything copied from them stay referenced until it is done
+            with _gc_paused():
+                entities_added = self._merge_products(first_product_z_offset)
                 
-                print(f"\nProcessing [{i+1}/{len(self.products)}]: {product.name} ({product.product_id})")
-                print(f"  Position (m): {product.position}")
-                print(f"  Z offset (mm): {product.z_offset_mm:.2f}")
-                
-                try:
-                    # Read the source DXF file
-                    source_doc = ezdxf.readfile(str(dxf_path))
-                    msp_source = source_doc.modelspace()
-                    
-                    # Get bounding box info
-                    bbox_data = self._get_bbox(msp_source)
-                    if bbox_data:
-                        min_x, min_y, max_x, max_y = bbox_data
-                        center_x = (min_x + max_x) / 2
-                        center_y = (min_y + max_y) / 2
-                        width = max_x - min_x
-                        height = max_y - min_y
-                        print(f"  BBox: ({min_x:.1f}, {min_y:.1f}) to ({max_x:.1f}, {max_y:.1f})")
-                        print(f"  Size: {width:.1f} x {height:.1f}, Center: ({center_x:.1f}, {center_y:.1f})")
-                    else:
-                        print(f"  Warning: Could not calculate bounding box")
-                    
-                    # Count entities before import
-                    entities_before = len(self.msp_output)
-                    
-                    # Use Importer to copy entities from source to output
-                    importer = Importer(source_doc, self.output_doc)
-                    importer.import_modelspace()
+                # Import the table entries and blocks required by all products
+                for importer in self._importers:
                     importer.finalize()
-                    
-                    # Count entities after import
-                    entities_after = len(self.msp_output)
-                    new_entities_count = entities_after - entities_before
-                    
-                    print(f"  Imported {new_entities_count} entities")
-                    
-                    # Calculate translation RELATIVE to the first product
-                    # Formula matches AssemblerContext.tsx positioning logic:
-                    # - First product is the anchor (leftmost), stays at X=0
-                    # - Other products are positioned to the RIGHT of it
-                    # - If first product has higher Z, other products with lower Z go to the right
-                    # translate_x = first_z_offset - product_z_offset
-                    #   First (z=48): 48 - 48 = 0 (anchor)
-                    #   Second (z=0): 48 - 0 = +48 (to the right)
-                    #   Third (z=-80): 48 - (-80) = +128 (further right)
-                    translate_x = first_product_z_offset - product.z_offset_mm
-                    translate_y = product.y_offset_mm  # Y stays as Y
-                    
-                    print(f"  Relative X translation: {first_product_z_offset:.1f} - {product.z_offset_mm:.1f} = {translate_x:.1f}mm")
-                    print(f"  Applying translation: X={translate_x:.1f}mm, Y={translate_y:.1f}mm")
-                    
-                    # Translate only the newly imported entities
-                    entities_list = list(self.msp_output)
-                    translated_count = 0
-                    for entity in entities_list[-new_entities_count:]:
-                        try:
-                            entity.translate(translate_x, translate_y, 0)
-                            translated_count += 1
-                        except Exception as e:
-                            print(f"    Warning: Could not translate entity {entity.dxftype()}: {e}")
-                    
-                    print(f"  Successfully translated {translated_count} entities")
-                    
-                except Exception as e:
-                    print(f"  Error processing {product.product_id}: {str(e)}")
-                    import traceback
-                    traceback.print_exc()
-                    continue
+                self._importers.clear()
+            
+            self._report_errors()
             
-            if len(self.msp_output) == 0:
-                print("Error: No entities were imported")
+            if entities_added == 0:
+                logger.error("No entities were imported")
                 return False
             
             # Save the merged DXF file
-            print(f"\nSaving assembly to: {self.output_path}")
-            self.output_doc.saveas(self.output_path)
+            logger.info("Saving assembly to: %s", self.output_path)
+            self.output_doc.saveas(self.output_path, fmt='bin' if self.binary else 'asc')
             
-            total_entities = len(self.msp_output)
-            print(f"DXF assembly completed successfully!")
-            print(f"Total entities in output: {total_entities}")
+            logger.info("DXF assembly completed successfully!")
+            logger.info("Total entities in output: %d", entities_added)
             
             return True
             
         except Exception as e:
-            print(f"Error during DXF assembly: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Error during DXF assembly: %s", e)
             return False
+        
+        finally:
+            # Release all parsed source documents in one go, also on failure
+            self._doc_cache.clear()
+            self._bbox_cache.clear()
 
 
 def main():
     """Main entry point for command line usage"""
-    if len(sys.argv) < 3:
-        print("Usage: python dxf_assembler.py <assembly_data.json> <output.dxf> [dxf_base_path]")
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    options = {a for a in sys.argv[1:] if a.startswith('--')}
+    
+    if len(args) < 2:
+        print("Usage: python dxf_assembler.py <assembly_data.json> <output.dxf> [dxf_base_path] [--explode] [--binary] [--verbose]")
         print("  assembly_data.json: JSON file with assembly product data")
         print("  output.dxf: Output DXF file path")
         print("  dxf_base_path: Base directory for DXF files (default: current directory)")
+        print("  --explode: Copy entities for every product instead of inserting shared blocks")
+        print("  --binary: Write binary DXF instead of ASCII DXF")
+        print("  --verbose: Report the bounding box and size of every product")
         print("\nIMPORTANT: Products are processed in the order they appear in the JSON.")
         print("           The sequence determines the assembly order.")
         print("\nExample:")
@@ -281,20 +605,30 @@ def main():
   ]''')
         sys.exit(1)
     
-    assembly_json_path = sys.argv[1]
-    output_path = sys.argv[2]
-    dxf_base_path = sys.argv[3] if len(sys.argv) > 3 else "."
+    # Progress output for this module only; ezdxf itself logs at INFO too
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr, format='%(message)s')
+    logger.setLevel(logging.INFO)
+    
+    assembly_json_path = args[0]
+    output_path = args[1]
+    dxf_base_path = args[2] if len(args) > 2 else "."
     
     # Load assembly data
     try:
-        with open(assembly_json_path, 'r') as f:
-            assembly_data = json.load(f)
+        with open(assembly_json_path, 'rb') as f:
+            assembly_data = orjson.loads(f.read())
     except Exception as e:
         print(f"Error loading JSON file: {e}")
         sys.exit(1)
     
     # Create assembler and run
-    assembler = DXFAssembler(dxf_base_path, output_path)
+    assembler = DXFAssembler(
+        dxf_base_path,
+        output_path,
+        use_blocks='--explode' not in options,
+        binary='--binary' in options,
+        verbose='--verbose' in options
+    )
     assembler.load_assembly_data(assembly_data)
     success = assembler.assemble()
     
@@ -7,24 +7,99 @@ Also provides STP to DXF conversion and DXF merging
 https://github.com/gumyr/build123d
 """
 
+import io
 import os
+import sys
+import time
+import queue
+import tempfile
+import atexit
+import logging
 import uuid
-import json
-import traceback
+import threading
 import zipfile
+import zlib
 import shutil
-from flask import Flask, request, jsonify, send_file
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Tuple
+import orjson
+from flask import Flask, Request, Response, request, jsonify, send_file
+from flask.json.provider import JSONProvider
 from werkzeug.utils import secure_filename
+from zipstream import ZipStream, ZIP_DEFLATED, ZIP_STORED
 from stp_assembler import STEPAssembler
 from stp_to_dxf_converter import STPtoDXFConverter
 from dxf_assembler import DXFAssembler
+from step_optimizer import STEPGraphOptimizer
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, used by jsonify() and request.json"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj), mimetype='application/json')
+
+
+class SpooledUploadRequest(Request):
+    """
+    Request that keeps uploaded files up to UPLOAD_SPOOL_SIZE in memory
+    
+    Werkzeug spills every upload of a request larger than 500KB to a temporary
+    file, which is then copied to the session folder. Typical STEP parts of a
+    few MB now stay in memory; larger ones spill to UPLOAD_SPOOL_FOLDER, not
+    UPLOAD_FOLDER, so a large part is not held twice on the uploads tmpfs.
+    """
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE, dir=UPLOAD_SPOOL_FOLDER)
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+app.request_class = SpooledUploadRequest
 
 # Configuration
-OUTPUT_FOLDER = '/app/output'
-UPLOAD_FOLDER = '/app/uploads'  # Temporary folder for uploaded STP files
+OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER', '/app/output')
+# Temporary folder for uploaded STP files; mount it as tmpfs (see docker-compose.yml)
+# so uploads are written and read back through memory instead of the disk
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', '/app/uploads')
 MAX_CONTENT_LENGTH = 500 * 1024 * 1024  # 500MB max total upload size
+# Deflate level for ZIP/gzip responses. Unless ZIP_COMPRESS_LEVEL is set, it is
+# picked by size: level 9 costs a lot of CPU for a few percent, small outputs are
+# dominated by fixed costs and for huge ones level 3 keeps the time in check
+ZIP_COMPRESS_LEVEL = int(os.environ['ZIP_COMPRESS_LEVEL']) if 'ZIP_COMPRESS_LEVEL' in os.environ else None
+ZIP_LEVEL_BY_SIZE = (
+    (1024 * 1024, 1),  # Below 1MB
+    (50 * 1024 * 1024, 6),  # Below 50MB
+)
+ZIP_LARGE_COMPRESS_LEVEL = 3  # 50MB and more
+ZIP_FAST_COMPRESS_LEVEL = 1  # Used when the request asks for ?fast=1
+ZIP_STORE_BELOW_SIZE = 16 * 1024  # Smaller DXF entries are stored uncompressed
+STEP_EXTENSIONS = frozenset({'.stp', '.step'})  # Accepted by /convert-to-dxf
+ASSEMBLE_FORMATS = ('zip', 'stp', 'gzip')  # Response formats of /assemble
+STREAM_CHUNK_SIZE = 1024 * 1024  # 1MB read size for streamed responses
+MAX_SAVE_WORKERS = 8  # Threads used to save the uploaded files of a request
+UPLOAD_BUFFER_SIZE = 1024 * 1024  # 1MB copy buffer when saving uploads (default 16KB)
+UPLOAD_SPOOL_SIZE = 16 * 1024 * 1024  # Uploaded files up to 16MB are parsed into memory
+# Disk directory for larger uploads while they are parsed (default: system temp dir)
+UPLOAD_SPOOL_FOLDER = os.environ.get('UPLOAD_SPOOL_FOLDER') or None
+# Processes per server worker for importing the STEP files of an assembly in
+# parallel. gunicorn already runs one worker per CPU and every import process
+# holds its own OCC instance, so this is off (1) unless set
+STEP_IMPORT_WORKERS = int(os.environ.get('STEP_IMPORT_WORKERS', 1))
+# Same for parsing the source files of /merge-dxf
+DXF_PARSE_WORKERS = int(os.environ.get('DXF_PARSE_WORKERS', 1))
+# Leftover uploads/outputs older than this are removed by the janitor thread
+FILE_TTL_SECONDS = int(os.environ.get('FILE_TTL_SECONDS', 3600))
+JANITOR_INTERVAL_SECONDS = 300
 
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
@@ -34,6 +109,232 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+
+logger = logging.getLogger(__name__)
+
+
+def _setup_logging() -> None:
+    """
+    Route log records through a queue: request threads only enqueue them and
+    a listener thread does the writes to stderr
+    """
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter('%(asctime)s [%(levelname)s] %(name)s: %(message)s'))
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.WARNING)  # Keeps library (e.g. ezdxf) chatter out
+    for name in (__name__, 'dxf_assembler'):
+        logging.getLogger(name).setLevel(LOG_LEVEL)
+
+
+_setup_logging()
+
+# Removes session folders and output files off the request threads
+_cleanup_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='cleanup')
+
+
+def remove_paths(*paths: str) -> None:
+    """Remove files and directories, skipping the ones that do not exist"""
+    for path in paths:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+                logger.debug("Cleaned up session folder: %s", path)
+            elif os.path.exists(path):
+                os.remove(path)
+                logger.debug("Cleaned up file: %s", path)
+        except Exception as e:
+            logger.warning("Could not remove %s: %s", path, e)
+
+
+def schedule_cleanup(*paths: str) -> None:
+    """Remove files and directories in the background"""
+    _cleanup_pool.submit(remove_paths, *paths)
+
+
+def sweep_stale_files() -> None:
+    """Remove entries of the upload and output folders older than FILE_TTL_SECONDS"""
+    cutoff = time.time() - FILE_TTL_SECONDS
+    for folder in (UPLOAD_FOLDER, OUTPUT_FOLDER):
+        stale = []
+        with os.scandir(folder) as entries:
+            for entry in entries:
+                try:
+                    if entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                        stale.append(entry.path)
+                except OSError:
+                    continue  # Removed by a finishing request meanwhile
+        remove_paths(*stale)
+
+
+def _janitor() -> None:
+    """Sweep stale files periodically, catches whatever failed requests left behind"""
+    while True:
+        time.sleep(JANITOR_INTERVAL_SECONDS)
+        try:
+            sweep_stale_files()
+        except Exception as e:
+            logger.warning("Stale file sweep failed: %s", e)
+
+
+threading.Thread(target=_janitor, name='janitor', daemon=True).start()
+
+
+# Assembler/converter instances reused by the requests of each worker thread
+_worker_local = threading.local()
+
+
+def get_step_assembler(stp_base_path: str, output_path: str) -> STEPAssembler:
+    """STEPAssembler of the current thread, reset to the given paths"""
+    assembler = getattr(_worker_local, 'step_assembler', None)
+    if assembler is None:
+        assembler = _worker_local.step_assembler = STEPAssembler(
+            stp_base_path, output_path, import_workers=STEP_IMPORT_WORKERS
+        )
+    else:
+        assembler.reset(stp_base_path, output_path)
+    return assembler
+
+
+def get_dxf_converter(output_folder: str) -> STPtoDXFConverter:
+    """STPtoDXFConverter of the current thread, reset to the given folder"""
+    converter = getattr(_worker_local, 'dxf_converter', None)
+    if converter is None:
+        converter = _worker_local.dxf_converter = STPtoDXFConverter(output_folder)
+    else:
+        converter.reset(output_folder)
+    return converter
+
+
+def get_query_flag(name: str) -> bool:
+    """Whether a boolean query parameter of the current request is set"""
+    return request.args.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def get_compress_level(size: int) -> int:
+    """
+    Deflate level for compressing data of the given size in the current request
+    
+    Args:
+        size: Size of the (uncompressed) data in bytes
+    """
+    if get_query_flag('fast'):
+        return ZIP_FAST_COMPRESS_LEVEL
+    if ZIP_COMPRESS_LEVEL is not None:
+        return ZIP_COMPRESS_LEVEL
+    for max_size, level in ZIP_LEVEL_BY_SIZE:
+        if size < max_size:
+            return level
+    return ZIP_LARGE_COMPRESS_LEVEL
+
+
+def estimate_assembly_size(session_folder: str, products: List[dict]) -> int:
+    """Estimate the size of a STEP assembly: the sizes of its product files, per use"""
+    sizes = {}
+    total = 0
+    for product in products:
+        product_id = product.get('productId', '')
+        if product_id not in sizes:
+            sizes[product_id] = os.path.getsize(os.path.join(session_folder, f"{product_id}.stp"))
+        total += sizes[product_id]
+    return total
+
+
+def save_uploaded_files(prefix: str, extension: str, session_folder: str) -> List[str]:
+    """
+    Save the uploaded files whose field name starts with prefix, in parallel
+    
+    Args:
+        prefix: Field name prefix, e.g. 'stp_' (the rest is the product ID)
+        extension: Extension of the saved files, e.g. 'stp'
+        session_folder: Directory to save the files to
+        
+    Returns:
+        Product IDs of the files saved as <productId>.<extension>, the name
+        the assemblers look up (secure_filename() may have renamed others)
+    """
+    start = len(prefix)
+    items = [
+        (key[start:], file, os.path.join(session_folder, secure_filename(f"{key[start:]}.{extension}")))
+        for key, file in request.files.items() if key.startswith(prefix)
+    ]
+    
+    # secure_filename() can map different field names to the same path; save
+    # only the last upload for each path (as sequential saving would leave
+    # it) so no two threads write the same file
+    files_by_path = {path: file for _, file, path in items}
+    
+    if files_by_path:
+        # Saving is I/O bound, the copies release the GIL
+        with ThreadPoolExecutor(max_workers=min(MAX_SAVE_WORKERS, len(files_by_path))) as executor:
+            list(executor.map(lambda item: item[1].save(item[0], UPLOAD_BUFFER_SIZE), files_by_path.items()))
+        if logger.isEnabledFor(logging.DEBUG):
+            for path in files_by_path:
+                logger.debug("Saved uploaded file: %s", os.path.basename(path))
+    
+    return [product_id for product_id, _, path in items
+            if os.path.basename(path) == f"{product_id}.{extension}"]
+
+
+def send_output_file(path: str, mimetype: str, download_name: str,
+                     cleanup_paths: Tuple[str, ...] = ()) -> Response:
+    """
+    Send a generated file as an attachment
+    
+    The files are one-off downloads, so conditional requests, ETag and
+    Last-Modified handling are skipped: the response is a plain file wrapper
+    which the WSGI server (e.g. gunicorn) can send with sendfile(2).
+    
+    Such a passthrough response never runs call_on_close() callbacks, so the
+    cleanup is scheduled right away instead: the file is opened first and the
+    open handle keeps its content readable after it has been removed.
+    
+    Args:
+        path: File to send
+        mimetype: MIME type of the response
+        download_name: File name suggested to the client
+        cleanup_paths: Files and directories to remove (may include path)
+    """
+    f = open(path, 'rb')
+    try:
+        response = send_file(
+            f,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=download_name,
+            conditional=False,
+            etag=False,
+            last_modified=None
+        )
+        response.content_length = os.fstat(f.fileno()).st_size
+    except Exception:
+        f.close()
+        raise
+    
+    schedule_cleanup(*cleanup_paths)
+    return response
+
+
+def gzip_file_chunks(path: str, level: int):
+    """Yield the gzip compressed content of a file, one chunk at a time"""
+    # wbits=31 makes zlib write a gzip header and trailer
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
+
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -55,11 +356,25 @@ def assemble_step_files():
         - Body:
             - assemblyData: JSON string with products array and fileName
             - files: Multiple STP files (field name: "stp_<productId>")
+        - Query:
+            - format: Optional, "zip" (default), "stp" or "gzip"
+            - fast: Optional, "1" to trade size for speed (compresslevel=1)
+            - optimize: Optional, "true" to merge duplicate points, directions and
+              placements in the STEP output (smaller, but slower to produce)
         
     Response:
-        - Success: Returns compressed ZIP file containing STEP assembly
+        - Success: Returns the STEP assembly as a compressed ZIP file,
+          as a plain .stp file (format=stp, sent with Content-Encoding: gzip
+          when the client accepts it) or as a .stp.gz file (format=gzip)
         - Error: Returns JSON with error message
     """
+    output_format = request.args.get('format', 'zip').lower()
+    if output_format not in ASSEMBLE_FORMATS:
+        return jsonify({
+            'error': 'Invalid format',
+            'message': f'format must be one of: {", ".join(ASSEMBLE_FORMATS)}'
+        }), 400
+    
     # Create a unique session folder for this assembly request
     session_id = str(uuid.uuid4())
     session_folder = os.path.join(app.config['UPLOAD_FOLDER'], session_id)
@@ -75,8 +390,8 @@ def assemble_step_files():
             }), 400
         
         try:
-            assembly_data = json.loads(assembly_data_str)
-        except json.JSONDecodeError as e:
+            assembly_data = orjson.loads(assembly_data_str)
+        except orjson.JSONDecodeError as e:
             return jsonify({
                 'error': 'Invalid JSON in assemblyData',
                 'message': str(e)
@@ -91,30 +406,16 @@ def assemble_step_files():
                 'message': 'Please provide an array of products to assemble'
             }), 400
         
-        print(f"Assembling {len(products)} products into STEP file")
-        print(f"Session folder: {session_folder}")
+        logger.info("Assembling %d products into STEP file", len(products))
+        logger.info("Session folder: %s", session_folder)
         
         # Save uploaded STP files to session folder
-        uploaded_files = []
-        for key in request.files:
-            if key.startswith('stp_'):
-                file = request.files[key]
-                product_id = key[4:]  # Remove 'stp_' prefix
-                filename = secure_filename(f"{product_id}.stp")
-                file_path = os.path.join(session_folder, filename)
-                file.save(file_path)
-                uploaded_files.append(product_id)
-                print(f"Saved uploaded file: {filename}")
-        
-        print(f"Uploaded {len(uploaded_files)} STP files")
-        
-        # Check that all required STEP files exist in session folder
-        missing_files = []
-        for product in products:
-            product_id = product.get('productId', '')
-            stp_path = os.path.join(session_folder, f"{product_id}.stp")
-            if not os.path.exists(stp_path):
-                missing_files.append(product_id)
+        uploaded_files = set(save_uploaded_files('stp_', 'stp', session_folder))
+        
+        logger.info("Uploaded %d STP files", len(uploaded_files))
+        
+        # Check that all required STEP files were uploaded
+        missing_files = sorted({p.get('productId', '') for p in products} - uploaded_files)
         
         if missing_files:
             return jsonify({
@@ -127,89 +428,105 @@ def assemble_step_files():
         output_filename = f"{session_id}_{file_name}.stp"
         output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
         
-        print(f"Output path: {output_path}")
-        
-        # Create assembler and perform assembly using session folder
-        assembler = STEPAssembler(session_folder, output_path)
+        # Create assembler using session folder
+        assembler = get_step_assembler(session_folder, output_path)
         assembler.load_assembly_data(products)
-        success = assembler.assemble()
+        optimize = get_query_flag('optimize')
+        
+        # A single file needs no ZIP container: send it as is or gzip it on the fly
+        if output_format != 'zip':
+            logger.info("Output path: %s", output_path)
+            
+            success = assembler.assemble()
+            
+            if not success:
+                return jsonify({
+                    'error': 'Assembly failed',
+                    'message': 'Failed to create STEP assembly from provided products'
+                }), 500
+            
+            # Check if output file was created
+            if not os.path.exists(output_path):
+                return jsonify({
+                    'error': 'Output file not created',
+                    'message': 'Assembly completed but output file was not generated'
+                }), 500
+            
+            if optimize:
+                original_size, optimized_size = STEPGraphOptimizer().optimize_file(output_path)
+                logger.info("Optimized STEP: %s -> %s bytes", f"{original_size:,}", f"{optimized_size:,}")
+            
+            if output_format == 'stp' and not request.accept_encodings['gzip']:
+                return send_output_file(output_path, 'application/step', f"{file_name}.stp",
+                                        cleanup_paths=(output_path, session_folder))
+            
+            # Compress on the fly: as a .stp.gz download (format=gzip), or as the
+            # Content-Encoding of the .stp for clients accepting gzip (format=stp)
+            level = get_compress_level(os.path.getsize(output_path))
+            response = Response(gzip_file_chunks(output_path, level))
+            if output_format == 'gzip':
+                response.mimetype = 'application/gzip'
+                download_name = f"{file_name}.stp.gz"
+            else:
+                response.mimetype = 'application/step'
+                response.headers['Content-Encoding'] = 'gzip'
+                response.vary.add('Accept-Encoding')
+                download_name = f"{file_name}.stp"
+            response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+            
+            # Schedule cleanup after sending
+            @response.call_on_close
+            def cleanup_step():
+                schedule_cleanup(output_path, session_folder)
+            
+            return response
+        
+        # Create compressed ZIP file, writing the STEP data straight into it
+        zip_filename = f"{session_id}_{file_name}.zip"
+        zip_path = os.path.join(app.config['OUTPUT_FOLDER'], zip_filename)
+        arcname = f"{file_name}.stp"
+        
+        # The STEP data is compressed while it is written, so its size is estimated
+        level = get_compress_level(estimate_assembly_size(session_folder, products))
+        logger.info("Creating compressed ZIP (level %d): %s", level, zip_path)
+        
+        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=level) as zipf:
+            with zipf.open(arcname, 'w', force_zip64=True) as dst:
+                if optimize:
+                    # The optimizer needs the whole file, assemble into memory first
+                    buffer = io.BytesIO()
+                    success = assembler.assemble_to(buffer)
+                    if success:
+                        dst.write(STEPGraphOptimizer().optimize(buffer.getvalue()))
+                    del buffer
+                else:
+                    success = assembler.assemble_to(dst)
+            original_size = zipf.getinfo(arcname).file_size
         
         if not success:
+            os.remove(zip_path)
             return jsonify({
                 'error': 'Assembly failed',
                 'message': 'Failed to create STEP assembly from provided products'
             }), 500
         
-        # Check if output file was created
-        if not os.path.exists(output_path):
-            return jsonify({
-                'error': 'Output file not created',
-                'message': 'Assembly completed but output file was not generated'
-            }), 500
-        
-        # Create compressed ZIP file with maximum compression
-        zip_filename = f"{session_id}_{file_name}.zip"
-        zip_path = os.path.join(app.config['OUTPUT_FOLDER'], zip_filename)
-        
-        print(f"Creating compressed ZIP: {zip_path}")
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zipf:
-            zipf.write(output_path, arcname=f"{file_name}.stp")
-        
         # Get file sizes for logging
-        original_size = os.path.getsize(output_path)
         compressed_size = os.path.getsize(zip_path)
         compression_ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
         
-        print(f"Original size: {original_size:,} bytes")
-        print(f"Compressed size: {compressed_size:,} bytes")
-        print(f"Compression ratio: {compression_ratio:.1f}%")
-        
-        # Clean up uncompressed STEP file
-        try:
-            os.remove(output_path)
-        except Exception as e:
-            print(f"Warning: Could not remove STEP file: {e}")
+        logger.info("Original size: %s bytes", f"{original_size:,}")
+        logger.info("Compressed size: %s bytes", f"{compressed_size:,}")
+        logger.info("Compression ratio: %.1f%%", compression_ratio)
         
         # Return the compressed ZIP file
-        response = send_file(
-            zip_path,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"{file_name}.zip"
-        )
-        
-        # Schedule cleanup after sending
-        @response.call_on_close
-        def cleanup():
-            # Clean up ZIP file
-            try:
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                    print(f"Cleaned up ZIP file: {zip_path}")
-            except Exception as e:
-                print(f"Warning: Could not remove ZIP file: {e}")
-            
-            # Clean up session folder with uploaded files
-            try:
-                if os.path.exists(session_folder):
-                    shutil.rmtree(session_folder)
-                    print(f"Cleaned up session folder: {session_folder}")
-            except Exception as e:
-                print(f"Warning: Could not remove session folder: {e}")
-        
-        return response
+        return send_output_file(zip_path, 'application/zip', f"{file_name}.zip",
+                                cleanup_paths=(zip_path, session_folder))
         
     except Exception as e:
-        print(f"Error during assembly: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error during assembly: %s", e)
         
         # Clean up session folder on error
-        try:
-            if os.path.exists(session_folder):
-                shutil.rmtree(session_folder)
-        except:
-            pass
+        schedule_cleanup(session_folder)
         
         return jsonify({
             'error': 'Internal server error',
@@ -230,6 +547,12 @@ def convert_stp_to_dxf():
             - views: Optional comma-separated list of views (top,front,right,section,iso)
             - section_z: Optional Z-height for section view (in mm)
         
+    Raw upload (skips multipart parsing, faster for large files):
+        - Content-Type: application/octet-stream
+        - Header X-Filename: Name of the STEP file
+        - Body: The STP file content
+        - Query: views and section_z as above
+        
     Response:
         - Success: Returns DXF file
         - Error: Returns JSON with error message
@@ -240,24 +563,39 @@ def convert_stp_to_dxf():
     os.makedirs(session_folder, exist_ok=True)
     
     try:
-        # Check if file is provided
-        if 'file' not in request.files:
-            return jsonify({
-                'error': 'No file provided',
-                'message': 'Please provide a STEP file with field name "file"'
-            }), 400
-        
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({
-                'error': 'No file selected',
-                'message': 'Please select a STEP file to convert'
-            }), 400
+        raw_upload = request.mimetype == 'application/octet-stream'
+        
+        if raw_upload:
+            # The body is the file itself, options come from the query string
+            options = request.args
+            filename = secure_filename(request.headers.get('X-Filename', ''))
+            if not filename:
+                return jsonify({
+                    'error': 'No file name provided',
+                    'message': 'Please provide the STEP file name in the X-Filename header'
+                }), 400
+        else:
+            options = request.form
+            
+            # Check if file is provided
+            if 'file' not in request.files:
+                return jsonify({
+                    'error': 'No file provided',
+                    'message': 'Please provide a STEP file with field name "file"'
+                }), 400
+            
+            file = request.files['file']
+            
+            if file.filename == '':
+                return jsonify({
+                    'error': 'No file selected',
+                    'message': 'Please select a STEP file to convert'
+                }), 400
+            
+            filename = secure_filename(file.filename)
         
         # Validate file extension
-        filename = secure_filename(file.filename)
-        if not filename.lower().endswith(('.stp', '.step')):
+        if os.path.splitext(filename)[1].lower() not in STEP_EXTENSIONS:
             return jsonify({
                 'error': 'Invalid file type',
                 'message': 'Please provide a STEP file (.stp or .step)'
@@ -265,18 +603,22 @@ def convert_stp_to_dxf():
         
         # Save the uploaded file
         input_path = os.path.join(session_folder, filename)
-        file.save(input_path)
+        if raw_upload:
+            with open(input_path, 'wb') as f:
+                shutil.copyfileobj(request.stream, f, UPLOAD_BUFFER_SIZE)
+        else:
+            file.save(input_path, UPLOAD_BUFFER_SIZE)
         
-        print(f"Received STEP file for DXF conversion: {filename}")
+        logger.info("Received STEP file for DXF conversion: %s", filename)
         
         # Get optional parameters
-        views_str = request.form.get('views', 'top,front,right')
+        views_str = options.get('views', 'top,front,right')
         views = [v.strip() for v in views_str.split(',') if v.strip()]
         
         section_z = None
-        if 'section_z' in request.form:
+        if 'section_z' in options:
             try:
-                section_z = float(request.form.get('section_z'))
+                section_z = float(options.get('section_z'))
             except ValueError:
                 pass
         
@@ -284,7 +626,7 @@ def convert_stp_to_dxf():
         output_name = os.path.splitext(filename)[0]
         
         # Convert to DXF
-        converter = STPtoDXFConverter(session_folder)
+        converter = get_dxf_converter(session_folder)
         success, output_path, message = converter.convert(
             input_path,
             output_name=output_name,
@@ -308,35 +650,14 @@ def convert_stp_to_dxf():
         # Return the DXF file
         dxf_filename = f"{output_name}.dxf"
         
-        response = send_file(
-            output_path,
-            mimetype='application/dxf',
-            as_attachment=True,
-            download_name=dxf_filename
-        )
-        
-        # Schedule cleanup after sending
-        @response.call_on_close
-        def cleanup():
-            try:
-                if os.path.exists(session_folder):
-                    shutil.rmtree(session_folder)
-                    print(f"Cleaned up session folder: {session_folder}")
-            except Exception as e:
-                print(f"Warning: Could not remove session folder: {e}")
-        
-        return response
+        return send_output_file(output_path, 'application/dxf', dxf_filename,
+                                cleanup_paths=(session_folder,))
         
     except Exception as e:
-        print(f"Error during DXF conversion: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error during DXF conversion: %s", e)
         
         # Clean up session folder on error
-        try:
-            if os.path.exists(session_folder):
-                shutil.rmtree(session_folder)
-        except:
-            pass
+        schedule_cleanup(session_folder)
         
         return jsonify({
             'error': 'Internal server error',
@@ -357,9 +678,14 @@ def convert_assembly_to_dxf():
             - assemblyData: JSON string with products array and fileName
             - files: Multiple STP files (field name: "stp_<productId>")
             - views: Optional comma-separated list of views (top,front,right,section,iso)
+        - Query:
+            - fast: Optional, "1" to trade ZIP size for speed (compresslevel=1)
+            - optimize: Optional, "true" to merge duplicate points, directions and
+              placements in the STEP assembly
         
     Response:
-        - Success: Returns ZIP file containing both STEP assembly and DXF file
+        - Success: Returns ZIP file containing both STEP assembly and DXF file,
+          streamed while it is being compressed
         - Error: Returns JSON with error message
     """
     # Create a unique session folder
@@ -377,8 +703,8 @@ def convert_assembly_to_dxf():
             }), 400
         
         try:
-            assembly_data = json.loads(assembly_data_str)
-        except json.JSONDecodeError as e:
+            assembly_data = orjson.loads(assembly_data_str)
+        except orjson.JSONDecodeError as e:
             return jsonify({
                 'error': 'Invalid JSON in assemblyData',
                 'message': str(e)
@@ -393,26 +719,13 @@ def convert_assembly_to_dxf():
                 'message': 'Please provide an array of products to assemble'
             }), 400
         
-        print(f"Converting assembly of {len(products)} products to DXF")
+        logger.info("Converting assembly of %d products to DXF", len(products))
         
         # Save uploaded STP files to session folder
-        uploaded_files = []
-        for key in request.files:
-            if key.startswith('stp_'):
-                file = request.files[key]
-                product_id = key[4:]  # Remove 'stp_' prefix
-                filename = secure_filename(f"{product_id}.stp")
-                file_path = os.path.join(session_folder, filename)
-                file.save(file_path)
-                uploaded_files.append(product_id)
-        
-        # Check that all required STEP files exist
-        missing_files = []
-        for product in products:
-            product_id = product.get('productId', '')
-            stp_path = os.path.join(session_folder, f"{product_id}.stp")
-            if not os.path.exists(stp_path):
-                missing_files.append(product_id)
+        uploaded_files = set(save_uploaded_files('stp_', 'stp', session_folder))
+        
+        # Check that all required STEP files were uploaded
+        missing_files = sorted({p.get('productId', '') for p in products} - uploaded_files)
         
         if missing_files:
             return jsonify({
@@ -424,7 +737,7 @@ def convert_assembly_to_dxf():
         # Step 1: Create STEP assembly
         assembly_stp_path = os.path.join(session_folder, f"{file_name}.stp")
         
-        assembler = STEPAssembler(session_folder, assembly_stp_path)
+        assembler = get_step_assembler(session_folder, assembly_stp_path)
         assembler.load_assembly_data(products)
         success = assembler.assemble()
         
@@ -434,11 +747,15 @@ def convert_assembly_to_dxf():
                 'message': 'Failed to create STEP assembly from provided products'
             }), 500
         
+        if get_query_flag('optimize'):
+            original_size, optimized_size = STEPGraphOptimizer().optimize_file(assembly_stp_path)
+            logger.info("Optimized STEP: %s -> %s bytes", f"{original_size:,}", f"{optimized_size:,}")
+        
         # Step 2: Convert assembly to DXF
         views_str = request.form.get('views', 'top,front,right')
         views = [v.strip() for v in views_str.split(',') if v.strip()]
         
-        converter = STPtoDXFConverter(session_folder)
+        converter = get_dxf_converter(session_folder)
         dxf_success, dxf_path, dxf_message = converter.convert(
             assembly_stp_path,
             output_name=file_name,
@@ -446,52 +763,40 @@ def convert_assembly_to_dxf():
         )
         
         if not dxf_success:
-            print(f"DXF conversion warning: {dxf_message}")
+            logger.warning("DXF conversion warning: %s", dxf_message)
             # Continue without DXF - we'll still return the STEP file
         
-        # Step 3: Create ZIP with both files
-        zip_filename = f"{session_id}_{file_name}.zip"
-        zip_path = os.path.join(app.config['OUTPUT_FOLDER'], zip_filename)
+        # Step 3: Stream a ZIP with both files, compressed while it is being sent
+        zs = ZipStream(compress_type=ZIP_DEFLATED)
         
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as zipf:
-            # Add STEP assembly
-            zipf.write(assembly_stp_path, arcname=f"{file_name}.stp")
-            
-            # Add DXF if conversion succeeded
-            if dxf_success and os.path.exists(dxf_path):
-                zipf.write(dxf_path, arcname=f"{file_name}.dxf")
+        # Add STEP assembly
+        zs.add_path(assembly_stp_path, arcname=f"{file_name}.stp",
+                    compress_level=get_compress_level(os.path.getsize(assembly_stp_path)))
         
-        # Return the ZIP file
-        response = send_file(
-            zip_path,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=f"{file_name}.zip"
-        )
+        # Add DXF if conversion succeeded (small ones stored, deflate gains little)
+        if dxf_success and os.path.exists(dxf_path):
+            dxf_size = os.path.getsize(dxf_path)
+            if dxf_size < ZIP_STORE_BELOW_SIZE:
+                zs.add_path(dxf_path, arcname=f"{file_name}.dxf", compress_type=ZIP_STORED)
+            else:
+                zs.add_path(dxf_path, arcname=f"{file_name}.dxf",
+                            compress_level=get_compress_level(dxf_size))
+        
+        # Return the ZIP stream
+        response = Response(zs, mimetype='application/zip')
+        response.headers.set('Content-Disposition', 'attachment', filename=f"{file_name}.zip")
         
-        # Schedule cleanup after sending
+        # Schedule cleanup once the stream is sent (it reads from the session folder)
         @response.call_on_close
         def cleanup():
-            try:
-                if os.path.exists(zip_path):
-                    os.remove(zip_path)
-                if os.path.exists(session_folder):
-                    shutil.rmtree(session_folder)
-                    print(f"Cleaned up session folder: {session_folder}")
-            except Exception as e:
-                print(f"Warning: Could not clean up: {e}")
+            schedule_cleanup(session_folder)
         
         return response
         
     except Exception as e:
-        print(f"Error during assembly DXF conversion: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error during assembly DXF conversion: %s", e)
         
-        try:
-            if os.path.exists(session_folder):
-                shutil.rmtree(session_folder)
-        except:
-            pass
+        schedule_cleanup(session_folder)
         
         return jsonify({
             'error': 'Internal server error',
@@ -513,6 +818,10 @@ def merge_dxf_files():
         - Body:
             - assemblyData: JSON string with products array (position info) and fileName
             - files: Multiple DXF files (field name: "dxf_<productId>")
+        - Query:
+            - blocks: Optional, "true" to import each product once as a block and
+              place every occurrence with an INSERT (smaller and faster to build)
+              instead of copying the entities into modelspace
         
     Response:
         - Success: Returns merged DXF file
@@ -533,8 +842,8 @@ def merge_dxf_files():
             }), 400
         
         try:
-            assembly_data = json.loads(assembly_data_str)
-        except json.JSONDecodeError as e:
+            assembly_data = orjson.loads(assembly_data_str)
+        except orjson.JSONDecodeError as e:
             return jsonify({
                 'error': 'Invalid JSON in assemblyData',
                 'message': str(e)
@@ -549,30 +858,16 @@ def merge_dxf_files():
                 'message': 'Please provide an array of products to merge'
             }), 400
         
-        print(f"Merging {len(products)} DXF files into assembly")
-        print(f"Session folder: {session_folder}")
+        logger.info("Merging %d DXF files into assembly", len(products))
+        logger.info("Session folder: %s", session_folder)
         
         # Save uploaded DXF files to session folder
-        uploaded_files = []
-        for key in request.files:
-            if key.startswith('dxf_'):
-                file = request.files[key]
-                product_id = key[4:]  # Remove 'dxf_' prefix
-                filename = secure_filename(f"{product_id}.dxf")
-                file_path = os.path.join(session_folder, filename)
-                file.save(file_path)
-                uploaded_files.append(product_id)
-                print(f"Saved uploaded DXF file: {filename}")
-        
-        print(f"Uploaded {len(uploaded_files)} DXF files")
-        
-        # Check that all required DXF files exist in session folder
-        missing_files = []
-        for product in products:
-            product_id = product.get('productId', '')
-            dxf_path = os.path.join(session_folder, f"{product_id}.dxf")
-            if not os.path.exists(dxf_path):
-                missing_files.append(product_id)
+        uploaded_files = set(save_uploaded_files('dxf_', 'dxf', session_folder))
+        
+        logger.info("Uploaded %d DXF files", len(uploaded_files))
+        
+        # Check that all required DXF files were uploaded
+        missing_files = sorted({p.get('productId', '') for p in products} - uploaded_files)
         
         if missing_files:
             return jsonify({
@@ -586,7 +881,13 @@ def merge_dxf_files():
         
         # Use DXFAssembler to create the assembly
         # Products are processed in the order provided (sequence matters!)
-        assembler = DXFAssembler(session_folder, output_path)
+        # Entities are copied into modelspace unless blocks are requested, so
+        # consumers that don't resolve INSERTs keep getting the same output
+        assembler = DXFAssembler(
+            session_folder, output_path,
+            use_blocks=get_query_flag('blocks'),
+            parse_workers=DXF_PARSE_WORKERS
+        )
         assembler.load_assembly_data(products)
         success = assembler.assemble()
         
@@ -604,38 +905,17 @@ def merge_dxf_files():
             }), 500
         
         output_size = os.path.getsize(output_path)
-        print(f"DXF assembly complete! Output size: {output_size:,} bytes")
+        logger.info("DXF assembly complete! Output size: %s bytes", f"{output_size:,}")
         
         # Return the merged DXF file
-        response = send_file(
-            output_path,
-            mimetype='application/dxf',
-            as_attachment=True,
-            download_name=f"{file_name}.dxf"
-        )
-        
-        # Schedule cleanup after sending
-        @response.call_on_close
-        def cleanup():
-            try:
-                if os.path.exists(session_folder):
-                    shutil.rmtree(session_folder)
-                    print(f"Cleaned up session folder: {session_folder}")
-            except Exception as e:
-                print(f"Warning: Could not remove session folder: {e}")
-        
-        return response
+        return send_output_file(output_path, 'application/dxf', f"{file_name}.dxf",
+                                cleanup_paths=(session_folder,))
         
     except Exception as e:
-        print(f"Error during DXF merge: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error during DXF merge: %s", e)
         
         # Clean up session folder on error
-        try:
-            if os.path.exists(session_folder):
-                shutil.rmtree(session_folder)
-        except:
-            pass
+        schedule_cleanup(session_folder)
         
         return jsonify({
             'error': 'Internal server error',
@@ -656,13 +936,16 @@ def index():
                 'content_type': 'multipart/form-data',
                 'parameters': {
                     'assemblyData': 'JSON string with products array and fileName',
-                    'stp_<productId>': 'STP file for each product (e.g., stp_382090006301)'
+                    'stp_<productId>': 'STP file for each product (e.g., stp_382090006301)',
+                    'format': 'Optional query parameter: zip (default), stp (gzip Content-Encoding if accepted) or gzip',
+                    'optimize': 'Optional query parameter: true to deduplicate points, directions and placements in the STEP output'
                 },
-                'response': 'Compressed ZIP file containing assembled STEP file'
+                'response': 'Compressed ZIP file containing assembled STEP file (or .stp / .stp.gz, see format)'
             },
             'POST /convert-to-dxf': {
                 'description': 'Convert a single STEP file to DXF format',
-                'content_type': 'multipart/form-data',
+                'content_type': 'multipart/form-data, or application/octet-stream with the file as body, '
+                                'its name in the X-Filename header and the options in the query string',
                 'parameters': {
                     'file': 'The STEP file to convert',
                     'views': 'Optional: comma-separated views (top,front,right,section,iso)',
@@ -676,7 +959,8 @@ def index():
                 'parameters': {
                     'assemblyData': 'JSON string with products array and fileName',
                     'stp_<productId>': 'STP file for each product',
-                    'views': 'Optional: comma-separated views (top,front,right,section,iso)'
+                    'views': 'Optional: comma-separated views (top,front,right,section,iso)',
+                    'optimize': 'Optional query parameter: true to deduplicate points, directions and placements in the STEP assembly'
                 },
                 'response': 'ZIP file containing STEP assembly and DXF file'
             },
@@ -685,7 +969,8 @@ def index():
                 'content_type': 'multipart/form-data',
                 'parameters': {
                     'assemblyData': 'JSON string with products array (with positions in meters) and fileName',
-                    'dxf_<productId>': 'DXF file for each product (e.g., dxf_382090006301)'
+                    'dxf_<productId>': 'DXF file for each product (e.g., dxf_382090006301)',
+                    'blocks': 'Optional query parameter: true to import each product once as a block and place every occurrence with an INSERT (smaller output) instead of copying the entities into modelspace'
                 },
                 'response': 'Merged DXF file with components positioned according to assembly data'
             },
@@ -697,12 +982,19 @@ def index():
         'usage': {
             'assemble': '''curl -X POST -F "assemblyData={...}" -F "stp_382090006301=@file1.stp" http://localhost:5001/assemble -o assembly.zip''',
             'convert_to_dxf': '''curl -X POST -F "file=@model.stp" -F "views=top,front,right" http://localhost:5001/convert-to-dxf -o model.dxf''',
+            'convert_to_dxf_raw': '''curl -X POST -H "Content-Type: application/octet-stream" -H "X-Filename: model.stp" --data-binary @model.stp "http://localhost:5001/convert-to-dxf?views=top,front,right" -o model.dxf''',
             'convert_assembly_to_dxf': '''curl -X POST -F "assemblyData={...}" -F "stp_382090006301=@file1.stp" -F "views=top,front" http://localhost:5001/convert-assembly-to-dxf -o assembly.zip''',
             'merge_dxf': '''curl -X POST -F "assemblyData={...}" -F "dxf_382090006301=@file1.dxf" -F "dxf_656905000800=@file2.dxf" http://localhost:5001/merge-dxf -o assembly.dxf'''
         },
         'compression': {
-            'level': 9,
-            'description': 'Maximum compression (ZIP_DEFLATED with compresslevel=9)'
+            'level': ZIP_COMPRESS_LEVEL if ZIP_COMPRESS_LEVEL is not None else 'adaptive',
+            'adaptive_levels': {
+                **{f'below_{max_size // (1024 * 1024)}mb': level for max_size, level in ZIP_LEVEL_BY_SIZE},
+                f'from_{ZIP_LEVEL_BY_SIZE[-1][0] // (1024 * 1024)}mb': ZIP_LARGE_COMPRESS_LEVEL
+            },
+            'fast_level': ZIP_FAST_COMPRESS_LEVEL,
+            'description': 'ZIP_DEFLATED (gzip for format=gzip/stp), level picked by output size unless '
+                           'ZIP_COMPRESS_LEVEL is set; add ?fast=1 for the fast level'
         }
     }), 200
 
@@ -726,9 +1018,10 @@ def internal_server_error(error):
 
 
 if __name__ == '__main__':
-    print("Starting STEP Assembler Server...")
-    print(f"Output folder: {OUTPUT_FOLDER}")
-    print(f"Upload folder: {UPLOAD_FOLDER}")
-    print("Server running on http://0.0.0.0:5001")
+    # Development server only, the container runs the app with gunicorn
+    logger.info("Starting STEP Assembler Server...")
+    logger.info("Output folder: %s", OUTPUT_FOLDER)
+    logger.info("Upload folder: %s", UPLOAD_FOLDER)
+    logger.info("Server running on http://0.0.0.0:5001")
     
     app.run(host='0.0.0.0', port=5001, debug=False)
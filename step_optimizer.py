@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+STEP Graph Optimizer
+Removes duplicated geometric value entities (points, directions, placements)
+from STEP files, e.g. the assemblies written by stp_assembler.py.
+Smaller files also compress better: zlib only sees repeats within 32KB.
+"""
+
+import re
+import sys
+from typing import Dict, FrozenSet, List, Tuple
+
+
+# Record in the DATA section: "#<id> = <body>;" where the body may contain
+# ';' inside quoted strings ('' is an escaped quote)
+_RECORD_RE = re.compile(rb"#(\d+)\s*=\s*((?:[^;']|'(?:[^']|'')*')*);")
+
+# Quoted string or entity reference, strings are matched so that a '#'
+# inside them is never taken for a reference
+_REFERENCE_RE = re.compile(rb"'(?:[^']|'')*'|#(\d+)")
+
+# Quoted string or whitespace, for normalizing record bodies
+_WHITESPACE_RE = re.compile(rb"'(?:[^']|'')*'|\s+")
+
+# Entity name at the start of a simple record body
+_ENTITY_NAME_RE = re.compile(rb"([A-Z0-9_]+)\s*\(")
+
+
+class STEPGraphOptimizer:
+    """Deduplicates value entities in STEP data and rewrites the references"""
+    
+    # Entities that are plain values (no identity), so equal instances can be
+    # merged without changing the model. Topology (edges, faces, ...) is kept.
+    DEDUP_ENTITIES: FrozenSet[str] = frozenset({
+        'CARTESIAN_POINT',
+        'DIRECTION',
+        'VECTOR',
+        'AXIS1_PLACEMENT',
+        'AXIS2_PLACEMENT_2D',
+        'AXIS2_PLACEMENT_3D',
+    })
+    
+    def __init__(self, entities: FrozenSet[str] = DEDUP_ENTITIES):
+        """
+        Initialize the optimizer
+        
+        Args:
+            entities: Names of the entity types that may be merged
+        """
+        self.entities = frozenset(name.encode('ascii') for name in entities)
+        self.removed = 0
+    
+    @staticmethod
+    def _normalize(body: bytes) -> bytes:
+        """Strip whitespace outside of strings from a record body"""
+        return _WHITESPACE_RE.sub(lambda m: m.group(0) if m.group(0)[:1] == b"'" else b"", body)
+    
+    @staticmethod
+    def _rewrite_references(text: bytes, mapping: Dict[bytes, bytes]) -> bytes:
+        """Replace the entity references in text according to mapping"""
+        def replace(m: re.Match) -> bytes:
+            ref = m.group(1)
+            if ref is None or ref not in mapping:
+                return m.group(0)
+            return b"#" + mapping[ref]
+        return _REFERENCE_RE.sub(replace, text)
+    
+    def optimize(self, data: bytes) -> bytes:
+        """
+        Deduplicate the value entities of STEP data
+        
+        Args:
+            data: Content of a STEP file
+        
+        Returns:
+            The optimized STEP data (unchanged if there is nothing to merge)
+        """
+        self.removed = 0
+        
+        start = data.find(b"\nDATA;")
+        end = data.find(b"\nENDSEC;", start)
+        if start < 0 or end < 0:
+            return data
+        start += len(b"\nDATA;")
+        
+        records: List[Tuple[bytes, bytes, bytes]] = []  # (id, body, record text)
+        candidates: Dict[bytes, bytes] = {}  # id -> normalized body
+        for m in _RECORD_RE.finditer(data, start, end):
+            entity_id, body = m.group(1), m.group(2)
+            records.append((entity_id, body, m.group(0)))
+            name = _ENTITY_NAME_RE.match(body)
+            if name and name.group(1) in self.entities:
+                candidates[entity_id] = self._normalize(body)
+        
+        # Merging points/directions makes the placements and vectors that use
+        # them equal as well, so repeat until no more duplicates are found
+        mapping: Dict[bytes, bytes] = {}
+        while True:
+            canonical: Dict[bytes, bytes] = {}  # normalized body -> id
+            merged = 0
+            for entity_id, body in candidates.items():
+                if entity_id in mapping:
+                    continue
+                key = self._rewrite_references(body, mapping) if mapping else body
+                kept_id = canonical.setdefault(key, entity_id)
+                if kept_id != entity_id:
+                    mapping[entity_id] = kept_id
+                    merged += 1
+            if not merged:
+                break
+            
+            # A kept id of an earlier pass may have been merged in this one:
+            # point every entry at the final id, so that no reference is
+            # rewritten to a record that is dropped
+            for entity_id, kept_id in mapping.items():
+                while kept_id in mapping:
+                    kept_id = mapping[kept_id]
+                mapping[entity_id] = kept_id
+        
+        if not mapping:
+            return data
+        self.removed = len(mapping)
+        
+        # Rebuild the DATA section without the merged records
+        output = [data[:start]]
+        for entity_id, _, text in records:
+            if entity_id not in mapping:
+                output.append(b"\n")
+                output.append(self._rewrite_references(text, mapping))
+        output.append(data[end:])
+        return b"".join(output)
+    
+    def optimize_file(self, input_path: str, output_path: str = None) -> Tuple[int, int]:
+        """
+        Deduplicate the value entities of a STEP file
+        
+        Args:
+            input_path: STEP file to optimize
+            output_path: Path for the optimized file (default: overwrite input)
+        
+        Returns:
+            Tuple of (original size, optimized size) in bytes
+        """
+        with open(input_path, 'rb') as f:
+            data = f.read()
+        
+        optimized = self.optimize(data)
+        
+        with open(output_path or input_path, 'wb') as f:
+            f.write(optimized)
+        
+        return len(data), len(optimized)
+
+
+def main():
+    """Main entry point for command line usage"""
+    if len(sys.argv) < 2:
+        print("Usage: python step_optimizer.py <input.stp> [output.stp]")
+        print("  output.stp: Optimized STEP file path (default: overwrite input)")
+        sys.exit(1)
+    
+    input_path = sys.argv[1]
+    output_path = sys.argv[2] if len(sys.argv) > 2 else None
+    
+    optimizer = STEPGraphOptimizer()
+    original_size, optimized_size = optimizer.optimize_file(input_path, output_path)
+    
+    print(f"Removed {optimizer.removed} duplicate entities")
+    print(f"Size: {original_size:,} -> {optimized_size:,} bytes")
+
+
+if __name__ == '__main__':
+    main()
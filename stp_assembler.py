@@ -6,12 +6,18 @@ Takes assembly data (positions, rotations, scales) and creates a combined STEP f
 https://github.com/gumyr/build123d
 """
 
+import os
 import sys
 import json
 import math
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
+from typing import BinaryIO, List, Dict, Tuple, Optional, Union
 
+import numpy as np
 from build123d import (
     Compound,
     import_step,
@@ -19,17 +25,64 @@ from build123d import (
     Location,
     Rotation,
 )
+from build123d.persistence import serialize_shape, deserialize_shape
 
 # OCP imports for advanced transformations
-from OCP.gp import gp_Trsf, gp_Vec, gp_Ax1, gp_Pnt, gp_Dir
+from OCP.gp import gp_Trsf, gp_Vec
 from OCP.BRepBuilderAPI import BRepBuilderAPI_Transform
 from OCP.TopoDS import TopoDS_Compound, TopoDS_Shape
 from OCP.BRep import BRep_Builder
+from OCP.TopLoc import TopLoc_Location
+
+
+# Worker processes for importing STEP files, shared by all assemblers of the
+# process. The workers are spawned rather than forked, since the caller
+# (e.g. the server) may have other threads running.
+_import_pool: Optional[ProcessPoolExecutor] = None
+_import_pool_lock = threading.Lock()
+
+# Below this total size the files are imported faster in this process than
+# through the worker processes
+_PARALLEL_IMPORT_MIN_SIZE = 4 * 1024 * 1024
+
+
+def _get_import_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Return the shared import pool, creating it on first use"""
+    global _import_pool
+    with _import_pool_lock:
+        if _import_pool is None:
+            _import_pool = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _import_pool
+
+
+def _discard_import_pool() -> None:
+    """Drop a broken import pool so the next assembly starts a new one"""
+    global _import_pool
+    with _import_pool_lock:
+        if _import_pool is not None:
+            _import_pool.shutdown(wait=False)
+            _import_pool = None
+
+
+def _import_step_shape(stp_path: str) -> bytes:
+    """Import a STEP file in a worker process and return the shape in binary BRep format"""
+    imported = import_step(stp_path)
+    occ_shape = imported.wrapped if hasattr(imported, 'wrapped') else imported
+    return serialize_shape(occ_shape)
 
 
 class AssemblyProduct:
     """Represents a product in the assembly with its transformation data"""
     
+    # One instance per BOM row, so skip the per-instance __dict__
+    __slots__ = (
+        'id', 'product_id', 'name', 'position', 'rotation', 'scale',
+        'parent_id', 'child_position', 'level',
+    )
+    
     def __init__(self, data: dict):
         self.id = data.get('id', '')
         self.product_id = data.get('productId', '')
@@ -56,10 +109,24 @@ class AssemblyProduct:
 class STEPAssembler:
     """Assembles STEP files into a single compound with transformations"""
     
-    def __init__(self, stp_base_path: str, output_path: str):
+    def __init__(self, stp_base_path: str, output_path: str, import_workers: Optional[int] = None):
         """
         Initialize the assembler
         
+        Args:
+            stp_base_path: Base directory containing STEP files
+            output_path: Path for the output assembly STEP file
+            import_workers: Processes for importing STEP files in parallel
+                            (default: CPU count, 1 imports in this process)
+        """
+        self.import_workers = import_workers if import_workers is not None else (os.cpu_count() or 1)
+        self.reset(stp_base_path, output_path)
+    
+    def reset(self, stp_base_path: str, output_path: str) -> None:
+        """
+        Re-point the assembler to new paths and drop all loaded data,
+        so one instance can be reused for several assemblies
+        
         Args:
             stp_base_path: Base directory containing STEP files
             output_path: Path for the output assembly STEP file
@@ -67,7 +134,7 @@ class STEPAssembler:
         self.stp_base_path = Path(stp_base_path)
         self.output_path = output_path
         self.products: List[AssemblyProduct] = []
-        self.shapes: List[TopoDS_Shape] = []
+        self._shape_cache: Dict[str, TopoDS_Shape] = {}
         
     def load_assembly_data(self, assembly_data: List[dict]) -> None:
         """Load assembly data from JSON list"""
@@ -78,6 +145,43 @@ class STEPAssembler:
         """Get the STEP file path for a product"""
         return self.stp_base_path / f"{product_id}.stp"
     
+    def _preload_shapes(self) -> None:
+        """
+        Import the STEP files of all products in parallel worker processes
+        and put the shapes into the shape cache
+        
+        Files that fail here are left to the regular import in assemble_to,
+        which reports the error for the product.
+        """
+        product_ids = list(dict.fromkeys(
+            product.product_id for product in self.products
+            if product.product_id not in self._shape_cache
+            and self._get_stp_path(product.product_id).exists()
+        ))
+        if self.import_workers <= 1 or len(product_ids) < 2:
+            return
+        
+        total_size = sum(self._get_stp_path(product_id).stat().st_size for product_id in product_ids)
+        if total_size < _PARALLEL_IMPORT_MIN_SIZE:
+            return
+        
+        print(f"Importing {len(product_ids)} STEP files with {self.import_workers} processes")
+        pool = _get_import_pool(self.import_workers)
+        futures = {
+            product_id: pool.submit(_import_step_shape, str(self._get_stp_path(product_id)))
+            for product_id in product_ids
+        }
+        
+        for product_id, future in futures.items():
+            try:
+                self._shape_cache[product_id] = deserialize_shape(future.result())
+            except BrokenProcessPool as e:
+                print(f"Warning: Import processes failed, importing in-process: {e}")
+                _discard_import_pool()
+                break
+            except Exception as e:
+                print(f"Warning: Parallel import of {product_id} failed: {e}")
+    
     def _meters_to_mm(self, meters: float) -> float:
         """Convert meters to millimeters (STEP files typically use mm)"""
         return meters * 1000.0
@@ -86,57 +190,92 @@ class STEPAssembler:
         """Convert radians to degrees"""
         return math.degrees(radians)
     
-    def _create_transformation(self, product: AssemblyProduct) -> gp_Trsf:
+    def _create_transformations(self, products: List[AssemblyProduct]) -> List[Optional[gp_Trsf]]:
         """
-        Create an OpenCascade transformation for a product
+        Create the OpenCascade transformations for products, with None for
+        a product that keeps its original placement
         
         The transformation is applied in the order:
         1. Scale (if not uniform 1,1,1)
         2. Rotation (X, Y, Z Euler angles)
         3. Translation (position)
+        
+        The composition Rx * Ry * Rz * T of every product is written directly
+        into one matrix, with the trig for all products computed by NumPy.
+        The translation is applied before the rotations, so the matrix holds
+        the rotated position R * t.
         """
-        trsf = gp_Trsf()
+        if not products:
+            return []
         
-        # Convert position from meters to millimeters
-        tx = self._meters_to_mm(product.position[0])
-        ty = self._meters_to_mm(product.position[1])
-        tz = self._meters_to_mm(product.position[2])
+        # Positions converted from meters to millimeters, rotations in radians
+        positions = np.array([product.position for product in products], dtype=np.float64) * 1000.0
+        rotations = np.array([product.rotation for product in products], dtype=np.float64)
         
-        # Get rotations in radians
-        rx, ry, rz = product.rotation
+        # Rotation matrices R = Rx * Ry * Rz (Euler angles XYZ order)
+        ca, cb, cg = np.cos(rotations).T
+        sa, sb, sg = np.sin(rotations).T
+        matrices = np.empty((len(products), 3, 4), dtype=np.float64)
+        matrices[:, 0, 0] = cb * cg
+        matrices[:, 0, 1] = -cb * sg
+        matrices[:, 0, 2] = sb
+        matrices[:, 1, 0] = ca * sg + sa * sb * cg
+        matrices[:, 1, 1] = ca * cg - sa * sb * sg
+        matrices[:, 1, 2] = -sa * cb
+        matrices[:, 2, 0] = sa * sg - ca * sb * cg
+        matrices[:, 2, 1] = sa * cg + ca * sb * sg
+        matrices[:, 2, 2] = ca * cb
+        matrices[:, :, 3] = np.einsum('nij,nj->ni', matrices[:, :, :3], positions)
         
-        # Apply rotations (Euler angles XYZ order)
-        # First create rotation transformations
-        if rx != 0:
-            rot_x = gp_Trsf()
-            rot_x.SetRotation(gp_Ax1(gp_Pnt(0, 0, 0), gp_Dir(1, 0, 0)), rx)
-            trsf = trsf.Multiplied(rot_x)
+        transforms: List[Optional[gp_Trsf]] = []
+        for values, position, rotated, moved in zip(
+            matrices.reshape(len(products), 12).tolist(),
+            positions.tolist(),
+            rotations.any(axis=1).tolist(),
+            positions.any(axis=1).tolist()
+        ):
+            if not rotated and not moved:
+                transforms.append(None)
+                continue
             
-        if ry != 0:
-            rot_y = gp_Trsf()
-            rot_y.SetRotation(gp_Ax1(gp_Pnt(0, 0, 0), gp_Dir(0, 1, 0)), ry)
-            trsf = trsf.Multiplied(rot_y)
-            
-        if rz != 0:
-            rot_z = gp_Trsf()
-            rot_z.SetRotation(gp_Ax1(gp_Pnt(0, 0, 0), gp_Dir(0, 0, 1)), rz)
-            trsf = trsf.Multiplied(rot_z)
-        
-        # Apply translation
-        trans = gp_Trsf()
-        trans.SetTranslation(gp_Vec(tx, ty, tz))
-        trsf = trsf.Multiplied(trans)
+            trsf = gp_Trsf()
+            if rotated:
+                trsf.SetValues(*values)
+            else:
+                trsf.SetTranslation(gp_Vec(*position))
+            transforms.append(trsf)
         
-        return trsf
+        return transforms
     
-    def _apply_transformation(self, shape: TopoDS_Shape, trsf: gp_Trsf) -> TopoDS_Shape:
+    def _apply_transformation(self, shape: TopoDS_Shape, trsf: Optional[gp_Trsf]) -> TopoDS_Shape:
         """Apply transformation to a shape"""
+        if trsf is None:
+            return shape
+        
+        # A rigid motion (rotation and translation) only changes the location
+        # of the shape, so all instances of a product share one geometry
+        if not trsf.IsNegative() and abs(trsf.ScaleFactor() - 1.0) <= TopLoc_Location.ScalePrec_s():
+            return shape.Moved(TopLoc_Location(trsf))
+        
         transformer = BRepBuilderAPI_Transform(shape, trsf, True)
         return transformer.Shape()
     
     def assemble(self) -> bool:
         """
-        Perform the assembly
+        Perform the assembly and write it to the output path
+        
+        Returns:
+            True if successful, False otherwise
+        """
+        return self.assemble_to(self.output_path)
+    
+    def assemble_to(self, dst: Union[str, BinaryIO]) -> bool:
+        """
+        Perform the assembly and write the STEP data to a path or file object
+        
+        Args:
+            dst: Output file path, or a writable binary file object
+                 (e.g. a ZIP entry opened with ZipFile.open(name, 'w'))
         
         Returns:
             True if successful, False otherwise
@@ -145,8 +284,24 @@ class STEPAssembler:
             print(f"Starting assembly with {len(self.products)} products")
             print(f"STEP files base path: {self.stp_base_path}")
             
+            # Import the distinct STEP files up front, in parallel
+            self._preload_shapes()
+            
+            # Transformations of all products, computed in one batch
+            transforms = self._create_transformations(self.products)
+            
+            # Transformed shapes are added to the compound as they are created
+            builder = BRep_Builder()
+            compound = TopoDS_Compound()
+            builder.MakeCompound(compound)
+            shape_count = 0
+            
+            # Unit conversions used for the log of every product
+            to_mm = self._meters_to_mm
+            to_degrees = self._radians_to_degrees
+            
             # Load and transform each product
-            for product in self.products:
+            for product, trsf in zip(self.products, transforms):
                 stp_path = self._get_stp_path(product.product_id)
                 
                 if not stp_path.exists():
@@ -155,30 +310,36 @@ class STEPAssembler:
                 
                 print(f"\nProcessing: {product.name} ({product.product_id})")
                 print(f"  Position (m): {product.position}")
-                print(f"  Position (mm): ({self._meters_to_mm(product.position[0]):.2f}, "
-                      f"{self._meters_to_mm(product.position[1]):.2f}, "
-                      f"{self._meters_to_mm(product.position[2]):.2f})")
+                print(f"  Position (mm): ({to_mm(product.position[0]):.2f}, "
+                      f"{to_mm(product.position[1]):.2f}, "
+                      f"{to_mm(product.position[2]):.2f})")
                 print(f"  Rotation (rad): {product.rotation}")
-                print(f"  Rotation (deg): ({self._radians_to_degrees(product.rotation[0]):.1f}, "
-                      f"{self._radians_to_degrees(product.rotation[1]):.1f}, "
-                      f"{self._radians_to_degrees(product.rotation[2]):.1f})")
+                print(f"  Rotation (deg): ({to_degrees(product.rotation[0]):.1f}, "
+                      f"{to_degrees(product.rotation[1]):.1f}, "
+                      f"{to_degrees(product.rotation[2]):.1f})")
                 print(f"  Child position: {product.child_position}")
                 
                 try:
-                    # Import the STEP file using build123d
-                    imported = import_step(str(stp_path))
+                    # Import each STEP file once, repeated parts reuse the
+                    # shape: it is never modified, each instance only adds
+                    # its own location to it
+                    occ_shape = self._shape_cache.get(product.product_id)
+                    if occ_shape is None:
+                        # Import the STEP file using build123d
+                        imported = import_step(str(stp_path))
+                        
+                        # Get the underlying OCC shape
+                        if hasattr(imported, 'wrapped'):
+                            occ_shape = imported.wrapped
+                        else:
+                            occ_shape = imported
+                        self._shape_cache[product.product_id] = occ_shape
                     
-                    # Get the underlying OCC shape
-                    if hasattr(imported, 'wrapped'):
-                        occ_shape = imported.wrapped
-                    else:
-                        occ_shape = imported
-                    
-                    # Create and apply transformation
-                    trsf = self._create_transformation(product)
+                    # Apply transformation
                     transformed_shape = self._apply_transformation(occ_shape, trsf)
                     
-                    self.shapes.append(transformed_shape)
+                    builder.Add(compound, transformed_shape)
+                    shape_count += 1
                     print(f"  Successfully added to assembly")
                     
                 except Exception as e:
@@ -187,23 +348,16 @@ class STEPAssembler:
                     traceback.print_exc()
                     continue
             
-            if not self.shapes:
+            if not shape_count:
                 print("Error: No shapes were successfully loaded")
                 return False
             
-            # Create compound from all shapes
-            print(f"\nCreating compound from {len(self.shapes)} shapes...")
-            builder = BRep_Builder()
-            compound = TopoDS_Compound()
-            builder.MakeCompound(compound)
-            
-            for shape in self.shapes:
-                builder.Add(compound, shape)
+            print(f"\nCreated compound from {shape_count} shapes")
             
             # Export the compound
-            print(f"Exporting assembly to: {self.output_path}")
+            print(f"Exporting assembly to: {dst if isinstance(dst, str) else 'stream'}")
             b123d_compound = Compound(compound)
-            export_step(b123d_compound, self.output_path)
+            export_step(b123d_compound, dst)
             
             print("Assembly completed successfully!")
             return True
@@ -213,6 +367,11 @@ class STEPAssembler:
             import traceback
             traceback.print_exc()
             return False
+        
+        finally:
+            # The imported shapes are only shared within one assembly, don't
+            # keep them alive while the (reused) assembler is idle
+            self._shape_cache.clear()
 
 
 def main():
@@ -10,6 +10,7 @@ import math
 from pathlib import Path
 from typing import Optional, Tuple, List
 
+import numpy as np
 import ezdxf
 from ezdxf import units
 
@@ -17,13 +18,37 @@ from build123d import import_step
 
 # OCP imports for edge extraction and projection
 from OCP.BRepAdaptor import BRepAdaptor_Curve
-from OCP.GCPnts import GCPnts_UniformDeflection
+from OCP.GCPnts import GCPnts_QuasiUniformDeflection
 from OCP.GeomAbs import GeomAbs_Line, GeomAbs_Circle, GeomAbs_Ellipse, GeomAbs_BSplineCurve
 from OCP.TopExp import TopExp_Explorer
 from OCP.TopAbs import TopAbs_EDGE
 from OCP.TopoDS import TopoDS
 
 
+# Standard isometric angles: 45 degrees about Z, 30 degrees about X
+_ISO_CZ = math.cos(math.pi / 4)
+_ISO_SZ = math.sin(math.pi / 4)
+_ISO_CX = math.cos(math.pi / 6)
+_ISO_SX = math.sin(math.pi / 6)
+_ISO_SZSX = _ISO_SZ * _ISO_SX
+_ISO_CZSX = _ISO_CZ * _ISO_SX
+
+# Rows map the relative x, y, z of a point to the 2D x, y of the iso view
+_ISO_PROJECTION = np.array([
+    [_ISO_CZ, _ISO_SZSX],
+    [-_ISO_SZ, _ISO_CZSX],
+    [0.0, _ISO_CX],
+])
+
+# Chord deviation for discretizing curves, relative to the model size but
+# never finer than 0.5 mm
+_MIN_DEFLECTION = 0.5
+_RELATIVE_DEFLECTION = 1e-3
+
+# Largest angle step when sampling circles and ellipses (12 per full turn)
+_MAX_CONIC_STEP = math.pi / 6
+
+
 class STPtoDXFConverter:
     """Converts STEP files to DXF format with 2D projections"""
     
@@ -31,6 +56,16 @@ class STPtoDXFConverter:
         """
         Initialize the converter
         
+        Args:
+            output_folder: Directory for output DXF files
+        """
+        self.reset(output_folder)
+    
+    def reset(self, output_folder: str) -> None:
+        """
+        Re-point the converter to a new output folder, so one instance can
+        be reused for several conversions
+        
         Args:
             output_folder: Directory for output DXF files
         """
@@ -98,7 +133,9 @@ class STPtoDXFConverter:
             
             center = ((xmin + xmax) / 2, (ymin + ymax) / 2, (zmin + zmax) / 2)
             size = (xmax - xmin, ymax - ymin, zmax - zmin)
-            max_dim = max(size) if max(size) > 0 else 100
+            max_dim = max(size)
+            if max_dim <= 0:
+                max_dim = 100
             
             print(f"Model bounding box: min=({xmin:.2f}, {ymin:.2f}, {zmin:.2f}), max=({xmax:.2f}, {ymax:.2f}, {zmax:.2f})")
             print(f"Model size: {size[0]:.2f} x {size[1]:.2f} x {size[2]:.2f}")
@@ -117,6 +154,12 @@ class STPtoDXFConverter:
                 'iso': (spacing * 3, 0),
             }
             
+            # Extract and discretize the edges once, every view projects
+            # the same 3D points
+            deflection = max(_MIN_DEFLECTION, max_dim * _RELATIVE_DEFLECTION)
+            edges = self._extract_edges(occ_shape, deflection)
+            print(f"Extracted {len(edges)} edges")
+            
             edges_added = 0
             
             # Generate each requested view
@@ -131,9 +174,9 @@ class STPtoDXFConverter:
                     # Get view offset
                     offset_x, offset_y = view_positions.get(view, (0, 0))
                     
-                    # Extract and project edges
+                    # Project edges
                     count = self._add_projected_edges(
-                        msp, occ_shape, view, layer_name,
+                        msp, edges, view, layer_name,
                         offset_x, offset_y, center
                     )
                     edges_added += count
@@ -160,23 +203,18 @@ class STPtoDXFConverter:
             traceback.print_exc()
             return False, "", f"Conversion failed: {str(e)}"
     
-    def _add_projected_edges(
-        self,
-        msp,
-        shape,
-        view: str,
-        layer_name: str,
-        offset_x: float,
-        offset_y: float,
-        center: Tuple[float, float, float]
-    ) -> int:
+    def _extract_edges(self, shape, deflection: float = _MIN_DEFLECTION) -> List[np.ndarray]:
         """
-        Extract edges from shape and project them to 2D for the given view
+        Extract all edges from shape and discretize them
         
+        Args:
+            shape: OCC shape to extract the edges from
+            deflection: Maximum chord deviation
+            
         Returns:
-            Number of edges added
+            List of (N, 3) point arrays, one per edge with at least 2 points
         """
-        edges_added = 0
+        edges = []
         
         # Extract all edges from the shape
         explorer = TopExp_Explorer(shape, TopAbs_EDGE)
@@ -187,53 +225,72 @@ class STPtoDXFConverter:
             try:
                 # Get curve adaptor
                 adaptor = BRepAdaptor_Curve(edge)
-                curve_type = adaptor.GetType()
                 
                 # Get discretized points
-                points_3d = self._discretize_edge(adaptor)
+                points_3d = self._discretize_edge(adaptor, deflection)
                 
                 if len(points_3d) >= 2:
-                    # Project points to 2D based on view
-                    points_2d = self._project_points(points_3d, view, center)
-                    
-                    # Apply offset
-                    points_2d = [(p[0] + offset_x, p[1] + offset_y) for p in points_2d]
-                    
-                    # Add to DXF
-                    if len(points_2d) == 2:
-                        # Simple line
-                        msp.add_line(
-                            points_2d[0],
-                            points_2d[1],
-                            dxfattribs={'layer': layer_name}
-                        )
-                    else:
-                        # Polyline for curves
-                        msp.add_lwpolyline(
-                            points_2d,
-                            dxfattribs={'layer': layer_name}
-                        )
-                    edges_added += 1
+                    edges.append(points_3d)
                     
             except Exception as e:
                 pass  # Skip problematic edges
             
             explorer.Next()
         
-        return edges_added
+        return edges
     
-    def _discretize_edge(self, adaptor: BRepAdaptor_Curve, deflection: float = 0.5) -> List[Tuple[float, float, float]]:
+    def _add_projected_edges(
+        self,
+        msp,
+        edges: List[np.ndarray],
+        view: str,
+        layer_name: str,
+        offset_x: float,
+        offset_y: float,
+        center: Tuple[float, float, float]
+    ) -> int:
+        """
+        Project discretized edges to 2D for the given view and add them to msp
+        
+        Returns:
+            Number of edges added
         """
-        Discretize an edge into a list of 3D points
+        if not edges:
+            return 0
+        
+        # Project the points of all edges in one go, then split them per edge
+        points_2d = self._project_points(
+            np.concatenate(edges), view, center, offset_x, offset_y
+        ).tolist()
+        ends = np.cumsum([len(points_3d) for points_3d in edges]).tolist()
+        projected = [points_2d[start:end] for start, end in zip([0] + ends, ends)]
+        
+        # Add to DXF, ezdxf copies the attribs so one dict serves all entities
+        dxfattribs = {'layer': layer_name}
+        add_line = msp.add_line
+        add_lwpolyline = msp.add_lwpolyline
+        for points_2d in projected:
+            if len(points_2d) == 2:
+                # Simple line
+                add_line(points_2d[0], points_2d[1], dxfattribs=dxfattribs)
+            else:
+                # Polyline for curves
+                add_lwpolyline(points_2d, format='xy', dxfattribs=dxfattribs)
+        
+        return len(projected)
+    
+    def _discretize_edge(self, adaptor: BRepAdaptor_Curve, deflection: float = _MIN_DEFLECTION) -> np.ndarray:
+        """
+        Discretize an edge into an array of 3D points
         
         Args:
             adaptor: BRepAdaptor_Curve for the edge
             deflection: Maximum chord deviation
             
         Returns:
-            List of (x, y, z) tuples
+            (N, 3) array of points, empty if the edge could not be discretized
         """
-        points = []
+        points = np.empty((0, 3), dtype=np.float64)
         
         try:
             curve_type = adaptor.GetType()
@@ -242,94 +299,116 @@ class STPtoDXFConverter:
             
             # For lines, just get start and end
             if curve_type == GeomAbs_Line:
-                p1 = adaptor.Value(first)
-                p2 = adaptor.Value(last)
-                points.append((p1.X(), p1.Y(), p1.Z()))
-                points.append((p2.X(), p2.Y(), p2.Z()))
+                points = np.array([adaptor.Value(first).Coord(), adaptor.Value(last).Coord()])
             else:
-                # For curves, use uniform deflection discretization
                 try:
-                    discretizer = GCPnts_UniformDeflection(adaptor, deflection)
+                    # Circles and ellipses are sampled in closed form
+                    if curve_type == GeomAbs_Circle or curve_type == GeomAbs_Ellipse:
+                        return self._sample_conic(adaptor, curve_type, first, last, deflection)
+                    
+                    # For other curves, use quasi-uniform deflection discretization
+                    discretizer = GCPnts_QuasiUniformDeflection(adaptor, deflection)
                     
                     if discretizer.IsDone():
                         num_points = discretizer.NbPoints()
-                        for i in range(1, num_points + 1):
-                            pnt = discretizer.Value(i)
-                            points.append((pnt.X(), pnt.Y(), pnt.Z()))
+                        points = np.empty((num_points, 3), dtype=np.float64)
+                        value = discretizer.Value
+                        for i in range(num_points):
+                            points[i] = value(i + 1).Coord()
                     else:
                         # Fallback to parameter-based sampling
                         num_samples = 20
+                        points = np.empty((num_samples + 1, 3), dtype=np.float64)
+                        value = adaptor.Value
                         for i in range(num_samples + 1):
                             t = first + (last - first) * i / num_samples
-                            pnt = adaptor.Value(t)
-                            points.append((pnt.X(), pnt.Y(), pnt.Z()))
+                            points[i] = value(t).Coord()
                 except:
                     # Ultimate fallback - just start and end
-                    p1 = adaptor.Value(first)
-                    p2 = adaptor.Value(last)
-                    points.append((p1.X(), p1.Y(), p1.Z()))
-                    points.append((p2.X(), p2.Y(), p2.Z()))
+                    points = np.array([adaptor.Value(first).Coord(), adaptor.Value(last).Coord()])
                 
         except Exception as e:
             pass
         
         return points
     
+    def _sample_conic(
+        self,
+        adaptor: BRepAdaptor_Curve,
+        curve_type,
+        first: float,
+        last: float,
+        deflection: float
+    ) -> np.ndarray:
+        """
+        Sample a circle or ellipse at evenly spaced parameters
+        
+        Args:
+            adaptor: BRepAdaptor_Curve for the edge
+            curve_type: GeomAbs_Circle or GeomAbs_Ellipse
+            first: First parameter of the edge
+            last: Last parameter of the edge
+            deflection: Maximum chord deviation
+            
+        Returns:
+            (N, 3) array of points
+        """
+        if curve_type == GeomAbs_Circle:
+            conic = adaptor.Circle()
+            major = minor = conic.Radius()
+        else:
+            conic = adaptor.Ellipse()
+            major, minor = conic.MajorRadius(), conic.MinorRadius()
+        
+        # Angle step whose chord deviates at most by deflection, the major
+        # radius bounds the deviation for an ellipse as well
+        step = min(2 * math.acos(1 - min(deflection / major, 1.0)), _MAX_CONIC_STEP)
+        num_segments = max(1, math.ceil((last - first) / step))
+        
+        t = np.linspace(first, last, num_segments + 1)
+        origin = np.array(conic.Location().Coord())
+        x_dir = np.array(conic.XAxis().Direction().Coord())
+        y_dir = np.array(conic.YAxis().Direction().Coord())
+        return origin + np.outer(major * np.cos(t), x_dir) + np.outer(minor * np.sin(t), y_dir)
+    
     def _project_points(
         self,
-        points_3d: List[Tuple[float, float, float]],
+        points_3d: np.ndarray,
         view: str,
-        center: Tuple[float, float, float]
-    ) -> List[Tuple[float, float]]:
+        center: Tuple[float, float, float],
+        offset_x: float = 0.0,
+        offset_y: float = 0.0
+    ) -> np.ndarray:
         """
         Project 3D points to 2D based on view type
         
         Args:
-            points_3d: List of (x, y, z) 3D points
+            points_3d: (N, 3) array of 3D points
             view: View type ('top', 'front', 'right', 'iso')
             center: Center of the model for positioning
+            offset_x: X offset of the view in the drawing
+            offset_y: Y offset of the view in the drawing
             
         Returns:
-            List of (x, y) 2D points
+            (N, 2) array of 2D points
         """
-        points_2d = []
-        cx, cy, cz = center
+        pts = points_3d - center
         
-        for x, y, z in points_3d:
-            if view == 'top':
-                # Top view: looking down Z axis, XY plane
-                px = x - cx
-                py = y - cy
-            elif view == 'front':
-                # Front view: looking along Y axis, XZ plane
-                px = x - cx
-                py = z - cz
-            elif view == 'right':
-                # Right view: looking along X axis, YZ plane
-                px = y - cy
-                py = z - cz
-            elif view == 'iso':
-                # Isometric projection
-                # Standard isometric angles
-                angle_x = math.radians(30)
-                angle_z = math.radians(45)
-                
-                # Transform to isometric
-                x_rel = x - cx
-                y_rel = y - cy
-                z_rel = z - cz
-                
-                px = x_rel * math.cos(angle_z) - y_rel * math.sin(angle_z)
-                py = x_rel * math.sin(angle_z) * math.sin(angle_x) + \
-                     y_rel * math.cos(angle_z) * math.sin(angle_x) + \
-                     z_rel * math.cos(angle_x)
-            else:
-                # Default to top view
-                px = x - cx
-                py = y - cy
-            
-            points_2d.append((px, py))
+        if view == 'front':
+            # Front view: looking along Y axis, XZ plane
+            points_2d = pts[:, [0, 2]]
+        elif view == 'right':
+            # Right view: looking along X axis, YZ plane
+            points_2d = pts[:, [1, 2]]
+        elif view == 'iso':
+            # Isometric projection
+            points_2d = pts @ _ISO_PROJECTION
+        else:
+            # Top view (default): looking down Z axis, XY plane
+            points_2d = pts[:, [0, 1]]
         
+        # Apply offset (the projection above always returns a new array)
+        points_2d += (offset_x, offset_y)
         return points_2d
 
 
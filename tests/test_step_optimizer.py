@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Tests for the STEP graph optimizer
+Run with: python -m unittest discover tests
+"""
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from step_optimizer import STEPGraphOptimizer
+
+
+HEADER = b"""ISO-10303-21;
+HEADER;
+FILE_NAME('test','',(''),(''),'','','');
+ENDSEC;
+DATA;
+"""
+
+FOOTER = b"""
+ENDSEC;
+END-ISO-10303-21;
+"""
+
+
+def make_step(*records: str) -> bytes:
+    """Build STEP data with the given DATA section records"""
+    return HEADER + "\n".join(records).encode('ascii') + FOOTER
+
+
+def parse_records(data: bytes) -> dict:
+    """Map the ids of the DATA section records to their bodies"""
+    return {
+        m.group(1): m.group(2)
+        for m in re.finditer(rb"#(\d+)\s*=\s*((?:[^;']|'(?:[^']|'')*')*);", data)
+    }
+
+
+def dangling_references(data: bytes) -> set:
+    """Ids referenced in the DATA section that have no record"""
+    records = parse_records(data)
+    referenced = set()
+    for body in records.values():
+        body = re.sub(rb"'(?:[^']|'')*'", b"", body)
+        referenced.update(re.findall(rb"#(\d+)", body))
+    return referenced - set(records)
+
+
+class STEPGraphOptimizerTest(unittest.TestCase):
+
+    def test_merges_equal_points(self):
+        data = make_step(
+            "#1=CARTESIAN_POINT('',(0.,0.,0.));",
+            "#2=CARTESIAN_POINT('',(0.,0.,0.));",
+            "#3=VERTEX_POINT('',#2);",
+        )
+        optimizer = STEPGraphOptimizer()
+        records = parse_records(optimizer.optimize(data))
+
+        self.assertEqual(optimizer.removed, 1)
+        self.assertNotIn(b"2", records)
+        self.assertEqual(records[b"3"], b"VERTEX_POINT('',#1)")
+
+    def test_keeps_data_without_duplicates(self):
+        data = make_step(
+            "#1=CARTESIAN_POINT('',(0.,0.,0.));",
+            "#2=CARTESIAN_POINT('',(1.,0.,0.));",
+        )
+        optimizer = STEPGraphOptimizer()
+
+        self.assertEqual(optimizer.optimize(data), data)
+        self.assertEqual(optimizer.removed, 0)
+
+    def test_keeps_topology(self):
+        data = make_step(
+            "#1=CARTESIAN_POINT('',(0.,0.,0.));",
+            "#2=VERTEX_POINT('',#1);",
+            "#3=VERTEX_POINT('',#1);",
+        )
+
+        self.assertEqual(STEPGraphOptimizer().optimize(data), data)
+
+    def test_ignores_references_in_strings(self):
+        data = make_step(
+            "#1=CARTESIAN_POINT('#2',(0.,0.,0.));",
+            "#2=CARTESIAN_POINT('#2',(0.,0.,0.));",
+            "#3=VERTEX_POINT('#2',#2);",
+        )
+        records = parse_records(STEPGraphOptimizer().optimize(data))
+
+        self.assertEqual(records[b"3"], b"VERTEX_POINT('#2',#1)")
+
+    def test_resolves_merges_across_passes(self):
+        # Pass 1 merges #3 into #2 and #11 into #10, which makes #2 equal to
+        # #1 in pass 2; the reference to #3 must end up at #1, not at #2
+        data = make_step(
+            "#1=AXIS2_PLACEMENT_3D('',#10,#12,#13);",
+            "#2=AXIS2_PLACEMENT_3D('',#11,#12,#13);",
+            "#3=AXIS2_PLACEMENT_3D('',#11,#12,#13);",
+            "#10=CARTESIAN_POINT('',(0.,0.,0.));",
+            "#11=CARTESIAN_POINT('',(0.,0.,0.));",
+            "#12=DIRECTION('',(0.,0.,1.));",
+            "#13=DIRECTION('',(1.,0.,0.));",
+            "#20=SHAPE_REPRESENTATION('',(#1,#3),#50);",
+            "#50=GEOMETRIC_REPRESENTATION_CONTEXT(3);",
+        )
+        optimizer = STEPGraphOptimizer()
+        optimized = optimizer.optimize(data)
+        records = parse_records(optimized)
+
+        self.assertEqual(optimizer.removed, 3)
+        self.assertEqual(dangling_references(optimized), set())
+        self.assertEqual(records[b"20"], b"SHAPE_REPRESENTATION('',(#1,#1),#50)")
+
+
+if __name__ == '__main__':
+    unittest.main()